@@ -0,0 +1,353 @@
+"""
+Bitboard backend for the game state.
+Keeps one 64-bit integer per piece plus occupancy masks next to the 8x8 board, so chessAI and main.py
+can keep reading gs.board while move generation and attack detection work on the bitboards.
+Square index is row * 8 + col, so square 0 is a8 and square 63 is h1, the same layout as gs.board.
+"""
+
+import time
+import ChessEngine
+
+pieceNames = ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+fullBoard = (1 << 64) - 1
+rookDirections = ((-1, 0), (0, -1), (1, 0), (0, 1))
+bishopDirections = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def bit(r, c):
+    return 1 << (r * 8 + c)
+
+
+# squares a piece on sq attacks along the given directions, stopping at the first occupied square
+def slidingAttacks(sq, directions, occupied):
+    r, c = divmod(sq, 8)
+    attacks = 0
+    for dr, dc in directions:
+        endRow = r + dr
+        endCol = c + dc
+        while 0 <= endRow < 8 and 0 <= endCol < 8:
+            attacks |= bit(endRow, endCol)
+            if occupied & bit(endRow, endCol):
+                break
+            endRow += dr
+            endCol += dc
+    return attacks
+
+
+# relevant blocker squares for a slider on sq - the board edge never blocks anything
+def blockerMask(sq, directions):
+    r, c = divmod(sq, 8)
+    mask = 0
+    for dr, dc in directions:
+        endRow = r + dr
+        endCol = c + dc
+        while 0 <= endRow + dr < 8 and 0 <= endCol + dc < 8:
+            mask |= bit(endRow, endCol)
+            endRow += dr
+            endCol += dc
+    return mask
+
+
+# magic bitboard style tables: every subset of the blocker mask maps straight to the attack set
+# a dict keyed by the masked occupancy does the perfect hashing a magic multiply does in C
+def buildSliderTables(directions):
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = blockerMask(sq, directions)
+        table = {}
+        subset = 0
+        while True: # carry rippler walks all subsets of mask
+            table[subset] = slidingAttacks(sq, directions, subset)
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+def buildStepAttacks(steps):
+    attacks = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        a = 0
+        for dr, dc in steps:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                a |= bit(r + dr, c + dc)
+        attacks.append(a)
+    return attacks
+
+
+knightAttacks = buildStepAttacks(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+kingAttacks = buildStepAttacks(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+pawnAttacks = {'w': buildStepAttacks(((-1, -1), (-1, 1))), 'b': buildStepAttacks(((1, -1), (1, 1)))} # squares a pawn on sq attacks
+rookMasks, rookTables = buildSliderTables(rookDirections)
+bishopMasks, bishopTables = buildSliderTables(bishopDirections)
+
+
+def rookAttacks(sq, occupied):
+    return rookTables[sq][occupied & rookMasks[sq]]
+
+
+def bishopAttacks(sq, occupied):
+    return bishopTables[sq][occupied & bishopMasks[sq]]
+
+
+# between[a][b] - squares strictly between a and b if they share a line, line[a][b] - the whole line through both
+between = [[0] * 64 for _ in range(64)]
+line = [[0] * 64 for _ in range(64)]
+for _sq in range(64):
+    for _dr, _dc in rookDirections + bishopDirections:
+        _r, _c = divmod(_sq, 8)
+        _ray = 0
+        _fullLine = slidingAttacks(_sq, ((_dr, _dc), (-_dr, -_dc)), 0) | (1 << _sq)
+        _r += _dr
+        _c += _dc
+        while 0 <= _r < 8 and 0 <= _c < 8:
+            between[_sq][_r * 8 + _c] = _ray
+            line[_sq][_r * 8 + _c] = _fullLine
+            _ray |= bit(_r, _c)
+            _r += _dr
+            _c += _dc
+
+rank3 = 0xff << 40 # row 5, where a white double push passes through
+rank6 = 0xff << 16 # row 2, the same for black
+promotionRanks = 0xff | (0xff << 56)
+
+
+def squares(bb): # yields the index of every set bit
+    while bb:
+        lowest = bb & -bb
+        yield lowest.bit_length() - 1
+        bb ^= lowest
+
+
+class BitboardGameState(ChessEngine.GameState):
+    backend = 'bitboard'
+
+    def rebuildDerivedState(self):
+        super().rebuildDerivedState()
+        self.syncBitboards()
+
+    # rebuilds every bitboard from self.board
+    def syncBitboards(self):
+        self.pieceBitboards = {piece: 0 for piece in pieceNames}
+        self.occupancy = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    self.pieceBitboards[piece] |= bit(r, c)
+                    self.occupancy[piece[0]] |= bit(r, c)
+
+    def makeMove(self, move):
+        super().makeMove(move)
+        self.toggleMove(move)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            super().undoMove()
+            self.toggleMove(move)
+
+    # xors a move into the bitboards, applying it the first time and taking it back the second time
+    def toggleMove(self, move):
+        bb = self.pieceBitboards
+        color = move.pieceMoved[0]
+        start = bit(move.startRow, move.startCol)
+        end = bit(move.endRow, move.endCol)
+        bb[move.pieceMoved] ^= start
+        bb[color + 'Q' if move.isPawnPromotion else move.pieceMoved] ^= end
+        self.occupancy[color] ^= start | end
+        if move.pieceCaptured != '--':
+            captured = bit(move.startRow, move.endCol) if move.isEnpassantMove else end
+            bb[move.pieceCaptured] ^= captured
+            self.occupancy[move.pieceCaptured[0]] ^= captured
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2: # kingside, rook hops from h to f
+                rookHop = bit(move.endRow, 7) | bit(move.endRow, 5)
+            else: # queenside, rook hops from a to d
+                rookHop = bit(move.endRow, 0) | bit(move.endRow, 3)
+            bb[color + 'R'] ^= rookHop
+            self.occupancy[color] ^= rookHop
+
+    # returns True if a piece of byColor attacks square, only counting pieces still on occupied
+    def squareAttackedBy(self, sq, byColor, occupied):
+        bb = self.pieceBitboards
+        if knightAttacks[sq] & bb[byColor + 'N'] & occupied:
+            return True
+        if pawnAttacks['b' if byColor == 'w' else 'w'][sq] & bb[byColor + 'p'] & occupied:
+            return True
+        if kingAttacks[sq] & bb[byColor + 'K']:
+            return True
+        queens = bb[byColor + 'Q']
+        if rookAttacks(sq, occupied) & (bb[byColor + 'R'] | queens) & occupied:
+            return True
+        return bishopAttacks(sq, occupied) & (bb[byColor + 'B'] | queens) & occupied != 0
+
+    # bitboard of every piece of byColor attacking sq
+    def attackersTo(self, sq, byColor, occupied):
+        bb = self.pieceBitboards
+        queens = bb[byColor + 'Q']
+        return ((knightAttacks[sq] & bb[byColor + 'N'])
+                | (pawnAttacks['b' if byColor == 'w' else 'w'][sq] & bb[byColor + 'p'])
+                | (kingAttacks[sq] & bb[byColor + 'K'])
+                | (rookAttacks(sq, occupied) & (bb[byColor + 'R'] | queens))
+                | (bishopAttacks(sq, occupied) & (bb[byColor + 'B'] | queens))) & occupied
+
+    def isSquareAttacked(self, square, byColor):
+        return self.squareAttackedBy(square[0] * 8 + square[1], byColor, self.occupancy['w'] | self.occupancy['b'])
+
+    def getValidMoves(self):
+        return self.generateMoves(False)
+
+    def getValidCaptures(self):
+        return self.generateMoves(True)
+
+    # legal moves, or only captures, en passant and promotions when capturesOnly is set
+    def generateMoves(self, capturesOnly):
+        us = 'w' if self.whiteToMove else 'b'
+        them = 'b' if self.whiteToMove else 'w'
+        bb = self.pieceBitboards
+        board = self.board
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+        targetSquares = enemy if capturesOnly else ~own
+        kingSq = bb[us + 'K'].bit_length() - 1
+        kingRow, kingCol = divmod(kingSq, 8)
+        moves = []
+
+        # king moves, checked with the king lifted so it cannot hide behind its own square
+        withoutKing = occupied ^ (1 << kingSq)
+        for to in squares(kingAttacks[kingSq] & targetSquares):
+            if not self.squareAttackedBy(to, them, withoutKing):
+                moves.append(ChessEngine.Move((kingRow, kingCol), divmod(to, 8), board))
+
+        checkers = self.attackersTo(kingSq, them, occupied)
+        if checkers & (checkers - 1) == 0: # not double check, other pieces may move
+            if checkers:
+                checkerSq = checkers.bit_length() - 1
+                targetMask = checkers | between[kingSq][checkerSq]
+            else:
+                targetMask = fullBoard
+
+            # pieces between the king and an enemy slider with nothing else in the way are pinned
+            pinned = 0
+            queens = bb[them + 'Q']
+            snipers = (rookAttacks(kingSq, 0) & (bb[them + 'R'] | queens)) | (bishopAttacks(kingSq, 0) & (bb[them + 'B'] | queens))
+            for sniper in squares(snipers):
+                blockers = between[kingSq][sniper] & occupied
+                if blockers and blockers & (blockers - 1) == 0 and blockers & own:
+                    pinned |= blockers
+
+            for pieceType in ('N', 'B', 'R', 'Q'):
+                for start in squares(bb[us + pieceType]):
+                    if pieceType == 'N':
+                        targets = knightAttacks[start]
+                    elif pieceType == 'B':
+                        targets = bishopAttacks(start, occupied)
+                    elif pieceType == 'R':
+                        targets = rookAttacks(start, occupied)
+                    else:
+                        targets = rookAttacks(start, occupied) | bishopAttacks(start, occupied)
+                    targets &= targetSquares & targetMask
+                    if pinned >> start & 1:
+                        targets &= line[kingSq][start]
+                    startSq = divmod(start, 8)
+                    for to in squares(targets):
+                        moves.append(ChessEngine.Move(startSq, divmod(to, 8), board))
+
+            self.getBitboardPawnMoves(us, them, occupied, enemy, kingSq, pinned, targetMask, moves, capturesOnly)
+            if not checkers and not capturesOnly:
+                self.getBitboardCastleMoves(us, them, occupied, kingSq, moves)
+
+        if capturesOnly: # quiet moves were never generated, so mate and stalemate are unknown
+            return moves
+        if len(moves) == 0: # either checkmate or stalemate
+            if checkers:
+                self.checkMate = True
+            else:
+                self.staleMate = True
+        else:
+            self.checkMate = False
+            self.staleMate = False
+        self.checkDrawRules()
+        return moves
+
+    def getBitboardPawnMoves(self, us, them, occupied, enemy, kingSq, pinned, targetMask, moves, capturesOnly=False):
+        board = self.board
+        pawns = self.pieceBitboards[us + 'p']
+        empty = ~occupied & fullBoard
+        if us == 'w':
+            step = -8
+            singles = (pawns >> 8) & empty
+            doubles = ((singles & rank3) >> 8) & empty
+        else:
+            step = 8
+            singles = (pawns << 8) & empty
+            doubles = ((singles & rank6) << 8) & empty
+        if capturesOnly: # only pushes onto the last rank promote
+            singles &= promotionRanks
+            doubles = 0
+        for pushes, distance in ((singles, step), (doubles, 2 * step)):
+            for to in squares(pushes & targetMask):
+                start = to - distance
+                if pinned >> start & 1 and not line[kingSq][start] >> to & 1:
+                    continue
+                moves.append(ChessEngine.Move(divmod(start, 8), divmod(to, 8), board))
+        for start in squares(pawns):
+            targets = pawnAttacks[us][start] & enemy & targetMask
+            if pinned >> start & 1:
+                targets &= line[kingSq][start]
+            for to in squares(targets):
+                moves.append(ChessEngine.Move(divmod(start, 8), divmod(to, 8), board))
+        if self.enpassantPossible != ():
+            epSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+            capturedSq = epSq - step
+            for start in squares(pawnAttacks[them][epSq] & pawns):
+                # both pawns leave the board, so test the king directly rather than trusting pins
+                after = occupied ^ (1 << start) ^ (1 << capturedSq) | (1 << epSq)
+                if not self.squareAttackedBy(kingSq, them, after):
+                    moves.append(ChessEngine.Move(divmod(start, 8), divmod(epSq, 8), board, isEnpassantMove=True))
+
+    def getBitboardCastleMoves(self, us, them, occupied, kingSq, moves):
+        rights = self.currentCastlingRights
+        kingside, queenside = (rights.wks, rights.wqs) if us == 'w' else (rights.bks, rights.bqs)
+        kingRow, kingCol = divmod(kingSq, 8)
+        if kingside and not occupied & (0b11 << (kingSq + 1)):
+            if not self.squareAttackedBy(kingSq + 1, them, occupied) and not self.squareAttackedBy(kingSq + 2, them, occupied):
+                moves.append(ChessEngine.Move((kingRow, kingCol), (kingRow, kingCol + 2), self.board, isCastleMove=True))
+        if queenside and not occupied & (0b111 << (kingSq - 3)):
+            if not self.squareAttackedBy(kingSq - 1, them, occupied) and not self.squareAttackedBy(kingSq - 2, them, occupied):
+                moves.append(ChessEngine.Move((kingRow, kingCol), (kingRow, kingCol - 2), self.board, isCastleMove=True))
+
+
+# counts leaf nodes of the legal move tree
+def countNodes(gs, depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        nodes += countNodes(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+# nodes/second of move generation plus make/undo for each backend from the starting position
+def benchmark(depth=3):
+    results = {}
+    for backend in ChessEngine.backends:
+        gs = ChessEngine.newGameState(backend)
+        start = time.perf_counter()
+        nodes = countNodes(gs, depth)
+        elapsed = time.perf_counter() - start
+        results[backend] = (nodes, nodes / elapsed)
+        print(backend, nodes, 'nodes', round(nodes / elapsed), 'nodes/s')
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
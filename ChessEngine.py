@@ -4,46 +4,210 @@ It will also be responsible for determining the valid moves at the current state
 It will also keep a move log
 """
 
+import os
+import random
+from evaluationTables import pieceScore, piecePositionScores
+
+# zobrist keys - one random 64-bit number per piece per square, plus side to move, castling rights and en passant file
+# xoring together the numbers for everything in a position gives its key
+zobristRandom = random.Random(20220601) # fixed seed so keys are the same in every process
+zobristPieces = {color + piece: [zobristRandom.getrandbits(64) for _ in range(64)] for color in 'wb' for piece in 'pNBRQK'}
+zobristPieces['--'] = [0] * 64 # empty squares add nothing
+zobristBlackToMove = zobristRandom.getrandbits(64)
+zobristCastling = {right: zobristRandom.getrandbits(64) for right in ('wks', 'wqs', 'bks', 'bqs')}
+zobristEnpassantFile = [zobristRandom.getrandbits(64) for _ in range(8)]
+
+# material and piece-square values of every piece on every square, positive for white and negative for black
+# positional values are kept in tenths so the running totals stay integers
+materialValues = {'--': [0] * 64}
+positionValues = {'--': [0] * 64}
+for _color, _sign in (('w', 1), ('b', -1)):
+    for _piece in 'pNBRQK':
+        _table = piecePositionScores.get(_color + _piece if _piece == 'p' else _piece)
+        materialValues[_color + _piece] = [_sign * pieceScore[_piece]] * 64
+        positionValues[_color + _piece] = [0 if _table is None else _sign * _table[sq // 8][sq % 8] for sq in range(64)]
+
+def zobristCastleKey(rights):
+    key = 0
+    if rights.wks:
+        key ^= zobristCastling['wks']
+    if rights.wqs:
+        key ^= zobristCastling['wqs']
+    if rights.bks:
+        key ^= zobristCastling['bks']
+    if rights.bqs:
+        key ^= zobristCastling['bqs']
+    return key
+
+
+# FEN letters for pieces, and rank strings already parsed - positions from one file share most of their ranks
+fenPieces = {'P': 'wp', 'N': 'wN', 'B': 'wB', 'R': 'wR', 'Q': 'wQ', 'K': 'wK',
+             'p': 'bp', 'n': 'bN', 'b': 'bB', 'r': 'bR', 'q': 'bQ', 'k': 'bK'}
+fenLetters = {piece: letter for letter, piece in fenPieces.items()}
+FEN_RANK_CACHE_SIZE = 100000
+fenRanks = {}
+
+# one byte per square in packed states, the index into this tuple
+pieceCodes = ('--', 'wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+pieceCodeIndex = {piece: i for i, piece in enumerate(pieceCodes)}
+
+
 class GameState():
-    def __init__(self):
+    backend = 'mailbox'
+    incrementalDebug = os.environ.get('CHESS_INCREMENTAL_DEBUG') == '1' # verify the zobrist key and score totals against a full recompute on every move
+    # starts from the initial position unless a board and the rest of a position are given, fromFEN is the usual way in
+    def __init__(self, board=None, whiteToMove=True, castlingRights=None, enpassantPossible=(), halfmoveClock=0, fullmoveNumber=1):
         # board is 8x8 2D list, each element has 2 characters
         # first letter is b or w (color)
         # second letter represents the type of piece (K - king, n - Knight)
         # string -- represents empty space with no piece
-        self.board = [
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
-
-        '''self.board = [
-            ["bR", "--", "bB", "--", "--", "--", "bK", "--"],
-            ["--", "--", "--", "--", "--", "--", "bp", "--"],
-            ["wp", "--", "bN", "--", "bp", "bR", "--", "bp"],
-            ["bQ", "--", "bp", "--", "--", "--", "--", "--"],
-            ["--", "bB", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "wN", "wp", "--", "wN", "--", "--"],
-            ["wp", "wp", "--", "wQ", "wB", "wp", "wp", "wp"],
-            ["wR", "--", "--", "--", "wK", "--", "--", "wR"]]'''
-
-
-      
+        if board is None:
+            board = [
+                ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
+                ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
+                ["--", "--", "--", "--", "--", "--", "--", "--"],
+                ["--", "--", "--", "--", "--", "--", "--", "--"],
+                ["--", "--", "--", "--", "--", "--", "--", "--"],
+                ["--", "--", "--", "--", "--", "--", "--", "--"],
+                ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
+                ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
+        self.board = board
         self.moveFunctions ={'p': self.getPawnMoves, 'R': self.getRookMoves, 'N': self.getKnightMoves, 
                             'B': self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves} # mapping each piece to a function
-        self.whiteToMove = True
+        self.whiteToMove = whiteToMove
+        self.enpassantPossible = enpassantPossible # co ords for the square where en passant capture is possible
+        self.currentCastlingRights = CastleRights(True, True, True, True) if castlingRights is None else castlingRights
+        self.halfmoveClock = halfmoveClock # moves since the last capture or pawn move
+        self.fullmoveNumber = fullmoveNumber # starts at 1 and goes up after every black move
+        self.rebuildDerivedState()
+
+    # builds a game state from a FEN string, missing trailing fields take their starting position values
+    # castling rights are only kept while the king and that rook are still on their starting squares
+    # positions that cannot come up in a game - not one king a side, a pawn on the first or last rank, or the side
+    # that just moved left in check - are rejected like bad syntax, move generation assumes they never happen
+    @classmethod
+    def fromFEN(cls, fen):
+        fields = fen.split()
+        if not fields:
+            raise ValueError("invalid FEN: " + fen)
+        ranks = fields[0].split('/')
+        if len(ranks) != 8:
+            raise ValueError("invalid FEN: " + fen)
+        board = []
+        for rankText in ranks:
+            row = fenRanks.get(rankText)
+            if row is None:
+                row = []
+                for ch in rankText:
+                    piece = fenPieces.get(ch)
+                    if piece is not None:
+                        row.append(piece)
+                    elif ch in '12345678':
+                        row.extend(["--"] * int(ch))
+                    else:
+                        raise ValueError("invalid FEN: " + fen)
+                if len(row) != 8:
+                    raise ValueError("invalid FEN: " + fen)
+                if len(fenRanks) < FEN_RANK_CACHE_SIZE:
+                    fenRanks[rankText] = row
+            board.append(list(row))
+        side = fields[1] if len(fields) > 1 else 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        enpassant = fields[3] if len(fields) > 3 else '-'
+        if side not in ('w', 'b') or (castling != '-' and not set(castling) <= set('KQkq')):
+            raise ValueError("invalid FEN: " + fen)
+        if enpassant == '-':
+            enpassantPossible = ()
+        elif len(enpassant) == 2 and enpassant[0] in Move.filesToCols and enpassant[1] in ('3', '6'):
+            enpassantPossible = (Move.ranksToRows[enpassant[1]], Move.filesToCols[enpassant[0]])
+        else:
+            raise ValueError("invalid FEN: " + fen)
+        try:
+            halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("invalid FEN: " + fen)
+        pieces = [piece for row in board for piece in row]
+        if pieces.count('wK') != 1 or pieces.count('bK') != 1:
+            raise ValueError("invalid FEN, each side needs one king: " + fen)
+        if any(piece[1] == 'p' for piece in board[0] + board[7]):
+            raise ValueError("invalid FEN, pawn on the first or last rank: " + fen)
+        whiteKingHome = board[7][4] == 'wK'
+        blackKingHome = board[0][4] == 'bK'
+        rights = CastleRights('K' in castling and whiteKingHome and board[7][7] == 'wR',
+                              'k' in castling and blackKingHome and board[0][7] == 'bR',
+                              'Q' in castling and whiteKingHome and board[7][0] == 'wR',
+                              'q' in castling and blackKingHome and board[0][0] == 'bR')
+        gs = cls(board, side == 'w', rights, enpassantPossible, halfmoveClock, fullmoveNumber)
+        if gs.isSquareAttacked(gs.blackKingLocation if gs.whiteToMove else gs.whiteKingLocation, side):
+            raise ValueError("invalid FEN, the side not to move is in check: " + fen)
+        return gs
+
+    # the position as a FEN string, fromFEN(toFEN()) gives back the same position, rights, clocks and all
+    def toFEN(self):
+        ranks = []
+        for row in self.board:
+            rankText = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                else:
+                    if empty:
+                        rankText += str(empty)
+                        empty = 0
+                    rankText += fenLetters[piece]
+            if empty:
+                rankText += str(empty)
+            ranks.append(rankText)
+        rights = self.currentCastlingRights
+        castling = ('K' if rights.wks else '') + ('Q' if rights.wqs else '') + ('k' if rights.bks else '') + ('q' if rights.bqs else '')
+        if self.enpassantPossible == ():
+            enpassant = '-'
+        else:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        return ' '.join(('/'.join(ranks), 'w' if self.whiteToMove else 'b', castling or '-', enpassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)))
+
+    # 66 byte snapshot of the position for sending to other processes - one byte per square,
+    # then side to move and castling rights as bit flags, then the en passant square (64 for none)
+    # the move history is not included
+    def toBytes(self):
+        rights = self.currentCastlingRights
+        flags = (1 if self.whiteToMove else 0) | rights.wks << 1 | rights.wqs << 2 | rights.bks << 3 | rights.bqs << 4
+        enpassant = 64 if self.enpassantPossible == () else self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+        return bytes([pieceCodeIndex[piece] for row in self.board for piece in row] + [flags, enpassant])
+
+    @classmethod
+    def fromBytes(cls, data):
+        board = [[pieceCodes[code] for code in data[r * 8:r * 8 + 8]] for r in range(8)]
+        flags = data[64]
+        rights = CastleRights(bool(flags & 2), bool(flags & 8), bool(flags & 4), bool(flags & 16))
+        return cls(board, bool(flags & 1), rights, () if data[65] == 64 else divmod(data[65], 8))
+
+    # resets the move history and recomputes everything that follows from the board, side to move,
+    # castling rights and en passant square - called whenever the position is set up rather than played into
+    def rebuildDerivedState(self):
         self.moveLog = []
         self.whiteKingLocation = (7, 4)
-        self.blackKingLocation = (0, 4) 
+        self.blackKingLocation = (0, 4)
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] == 'wK':
+                    self.whiteKingLocation = (r, c)
+                elif self.board[r][c] == 'bK':
+                    self.blackKingLocation = (r, c)
         self.checkMate = False
         self.staleMate = False
-        self.enpassantPossible = () # co ords for the square where en passant capture is possible
+        self.repetitionDraw = False # threefold repetition, set by getValidMoves like checkMate and staleMate
+        self.fiftyMoveDraw = False
         self.enPassantPossibleLog = [self.enpassantPossible]
-        self.currentCastlingRights = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.wqs, self.currentCastlingRights.bks, self.currentCastlingRights.bqs,)]
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.castleRightsLog = [CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks, self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)]
+        self.zobristKey = self.computeZobristKey() # identifies the position, updated incrementally by makeMove
+        self.zobristKeyLog = [] # key of every earlier position, the history repetitions are found in
+        self.materialScore, self.positionScore = self.computeScores() # running evaluation totals, updated by makeMove
+        self.scoreLog = []
         
 
 
@@ -84,9 +248,21 @@ class GameState():
                   self.board[move.endRow][move.endCol-2] = '--' # erase old rook
 
       self.enPassantPossibleLog.append(self.enpassantPossible) 
+      # move clocks
+      if move.pieceMoved[1] == 'p' or move.pieceCaptured != '--':
+          self.halfmoveClock = 0
+      else:
+          self.halfmoveClock += 1
+      if move.pieceMoved[0] == 'b':
+          self.fullmoveNumber += 1
+      self.halfmoveClockLog.append(self.halfmoveClock)
+      self.repetitionDraw = False # unknown for the new position until getValidMoves
+      self.fiftyMoveDraw = False
       # update castling rights - whenever it is a rook or a king move
       self.updateCastleRights(move)
-      self.castleRightsLog.append(CastleRights(self.currentCastlingRights.wks,       self.currentCastlingRights.wqs, self.currentCastlingRights.bks, self.currentCastlingRights.bqs,))
+      self.castleRightsLog.append(CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks, self.currentCastlingRights.wqs, self.currentCastlingRights.bqs))
+      self.updateZobristKey(move)
+      self.updateScores(move)
 
       
         
@@ -109,11 +285,16 @@ class GameState():
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
                 
             self.enPassantPossibleLog.pop() 
-            self.enPassantPossibleLog[-1]
+            self.enpassantPossible = self.enPassantPossibleLog[-1]
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            if move.pieceMoved[0] == 'b':
+                self.fullmoveNumber -= 1
 
             # undo castling rights
             self.castleRightsLog.pop() # get rid of new castle rights from the move we are undoing
-            self.currentCastlingRights = self.castleRightsLog[-1] # setting the castle rights to the previous moves ones
+            previousRights = self.castleRightsLog[-1] # setting the castle rights to the previous moves ones
+            self.currentCastlingRights = CastleRights(previousRights.wks, previousRights.bks, previousRights.wqs, previousRights.bqs) # copy so the log entry is never mutated
             # undo the castle move
             if move.isCastleMove:
                 if move.endCol - move.startCol == 2: # kingside
@@ -122,12 +303,129 @@ class GameState():
                 else:
                     self.board[move.endRow][move.endCol-2] = self.board[move.endRow][move.endCol+1]
                     self.board[move.endRow][move.endCol+1] = '--'
+            self.zobristKey = self.zobristKeyLog.pop()
+            self.materialScore, self.positionScore = self.scoreLog.pop()
             self.checkMate = False
             self.staleMate = False 
+            self.repetitionDraw = False
+            self.fiftyMoveDraw = False
+            if self.incrementalDebug:
+                self.verifyIncrementalState(move)
+
+    # passes the turn without moving, for null-move pruning - never legal in a game, and never while in check
+    # the move log gets a None so the search still counts the ply, and the halfmove clock restarts at 0 since no
+    # repetition can reach back across a pass
+    def makeNullMove(self):
+        self.moveLog.append(None)
+        self.whiteToMove = not self.whiteToMove
+        self.zobristKeyLog.append(self.zobristKey)
+        key = self.zobristKey ^ zobristBlackToMove
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassantFile[self.enpassantPossible[1]]
+        self.zobristKey = key
+        self.enpassantPossible = ()
+        self.enPassantPossibleLog.append(())
+        self.halfmoveClock = 0
+        self.halfmoveClockLog.append(0)
+        self.checkMate = False
+        self.staleMate = False
+        self.repetitionDraw = False
+        self.fiftyMoveDraw = False
+
+    def undoNullMove(self):
+        self.moveLog.pop()
+        self.whiteToMove = not self.whiteToMove
+        self.zobristKey = self.zobristKeyLog.pop()
+        self.enPassantPossibleLog.pop()
+        self.enpassantPossible = self.enPassantPossibleLog[-1]
+        self.halfmoveClockLog.pop()
+        self.halfmoveClock = self.halfmoveClockLog[-1]
+        self.checkMate = False
+        self.staleMate = False
+        self.repetitionDraw = False
+        self.fiftyMoveDraw = False
 
 
               
 
+    # xors out everything the move changed and xors in the new state, called at the end of makeMove
+    def updateZobristKey(self, move):
+        self.zobristKeyLog.append(self.zobristKey)
+        key = self.zobristKey ^ zobristBlackToMove
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        key ^= zobristPieces[move.pieceMoved][startSq]
+        key ^= zobristPieces[self.board[move.endRow][move.endCol]][endSq] # the queen after a promotion
+        if move.isEnpassantMove:
+            key ^= zobristPieces[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        else:
+            key ^= zobristPieces[move.pieceCaptured][endSq]
+        if move.isCastleMove:
+            rook = move.pieceMoved[0] + 'R'
+            rowStart = move.endRow * 8
+            if move.endCol - move.startCol == 2: # rook hops from h to f
+                key ^= zobristPieces[rook][rowStart + 7] ^ zobristPieces[rook][rowStart + 5]
+            else: # rook hops from a to d
+                key ^= zobristPieces[rook][rowStart] ^ zobristPieces[rook][rowStart + 3]
+        previousEnpassant = self.enPassantPossibleLog[-2]
+        if previousEnpassant != ():
+            key ^= zobristEnpassantFile[previousEnpassant[1]]
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassantFile[self.enpassantPossible[1]]
+        key ^= zobristCastleKey(self.castleRightsLog[-2]) ^ zobristCastleKey(self.currentCastlingRights)
+        self.zobristKey = key
+
+    # full recompute of the zobrist key from the board, side to move, castling rights and en passant square
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                key ^= zobristPieces[self.board[r][c]][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= zobristBlackToMove
+        key ^= zobristCastleKey(self.currentCastlingRights)
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassantFile[self.enpassantPossible[1]]
+        return key
+
+    # adds the material and piece-square change of the move to the running totals, called at the end of makeMove
+    def updateScores(self, move):
+        self.scoreLog.append((self.materialScore, self.positionScore))
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        finalPiece = self.board[move.endRow][move.endCol] # the queen after a promotion
+        capturedSq = move.startRow * 8 + move.endCol if move.isEnpassantMove else endSq
+        material = materialValues[finalPiece][endSq] - materialValues[move.pieceMoved][startSq] - materialValues[move.pieceCaptured][capturedSq]
+        position = positionValues[finalPiece][endSq] - positionValues[move.pieceMoved][startSq] - positionValues[move.pieceCaptured][capturedSq]
+        if move.isCastleMove:
+            rook = positionValues[move.pieceMoved[0] + 'R']
+            rowStart = move.endRow * 8
+            if move.endCol - move.startCol == 2: # rook hops from h to f
+                position += rook[rowStart + 5] - rook[rowStart + 7]
+            else: # rook hops from a to d
+                position += rook[rowStart + 3] - rook[rowStart]
+        self.materialScore += material
+        self.positionScore += position
+        if self.incrementalDebug:
+            self.verifyIncrementalState(move)
+
+    # full recompute of (material, positional tenths) from the board
+    def computeScores(self):
+        material = 0
+        position = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                material += materialValues[piece][r * 8 + c]
+                position += positionValues[piece][r * 8 + c]
+        return material, position
+
+    def verifyIncrementalState(self, move):
+        if self.zobristKey != self.computeZobristKey():
+            raise RuntimeError("zobrist key out of sync after " + move.getChessNotation())
+        if (self.materialScore, self.positionScore) != self.computeScores():
+            raise RuntimeError("score totals out of sync after " + move.getChessNotation())
+
     # updating castling rights - whenever a rook or king moves
     def updateCastleRights(self, move):
         if move.pieceMoved == 'wK':
@@ -165,56 +463,275 @@ class GameState():
 
 
                   
-    # all moves considering checks
+    # all moves considering checks and pins, without making and undoing every move
     def getValidMoves(self):
-        tempEnpassantPossible = self.enpassantPossible
-        tempCastleRights = CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks, self.currentCastlingRights.wqs, self.currentCastlingRights.bqs) # copies current castling rights
-        # 1. get all possible moves
-        moves = self.getAllPossibleMoves()
+        moves = []
+        inCheck, pins, checks = self.checkForPinsAndChecks()
         if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
+            kingRow, kingCol = self.whiteKingLocation
         else:
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
-        # 2. for each move, make the move
-        for i in range(len(moves)-1, -1, -1): # when removing from a list go backwards
-            self.makeMove(moves[i])
-            # 3. generate all opponents moves
-            # 4. for each of the opponents moves, see if they attack the king
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                # 5. if they do attack king, not a valid move  
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
-        if len(moves) == 0: # either checkmate or stalemate
-          if self. inCheck():
-              self.checkMate = True
-          else: 
-              self.staleMate = True
+            kingRow, kingCol = self.blackKingLocation
+        if len(checks) > 1: # double check, king has to move
+            self.getKingMoves(kingRow, kingCol, moves)
+        else:
+            moves = self.getAllPossibleMoves()
+            if not inCheck:
+                self.getCastleMoves(kingRow, kingCol, moves)
+        legalMoves = self.filterLegalMoves(moves, pins, checks, kingRow, kingCol)
+        if len(legalMoves) == 0: # either checkmate or stalemate
+            if inCheck:
+                self.checkMate = True
+            else:
+                self.staleMate = True
         else:
             self.checkMate = False
             self.staleMate = False
+        self.checkDrawRules()
+        return legalMoves
 
-        self.enpassantPossible = tempEnpassantPossible 
-        self.currentCastlingRights = tempCastleRights
-        return moves
+    # sets the flags for a draw by threefold repetition or the fifty-move rule, a checkmate on the last move still counts
+    def checkDrawRules(self):
+        if self.halfmoveClock < 4 or self.checkMate: # a repetition needs at least four reversible moves
+            self.repetitionDraw = False
+            self.fiftyMoveDraw = False
+        else:
+            self.repetitionDraw = self.repetitionCount() >= 2
+            self.fiftyMoveDraw = self.halfmoveClock >= 100
+
+    # the halfmove clock and the position keys since the last capture or pawn move - all the draw rules look at
+    # toBytes leaves them out, so whoever rebuilds a position elsewhere passes these along to setDrawHistory
+    def drawHistory(self):
+        keys = self.zobristKeyLog
+        return self.halfmoveClock, keys[len(keys) - min(self.halfmoveClock, len(keys)):]
+
+    def setDrawHistory(self, halfmoveClock, keys):
+        self.halfmoveClock = halfmoveClock
+        self.halfmoveClockLog = [halfmoveClock]
+        self.zobristKeyLog = list(keys)
+
+    # how many times the current position occurred before, same side to move, castling rights and en passant square
+    # only positions since the last capture or pawn move can repeat it, so the scan stops there
+    def repetitionCount(self):
+        keys = self.zobristKeyLog
+        key = self.zobristKey
+        count = 0
+        for i in range(len(keys) - 2, max(len(keys) - self.halfmoveClock, 0) - 1, -2):
+            if keys[i] == key:
+                count += 1
+        return count
+
+    # captures and promotions that are legal, for the quiescence search - skips quiet moves entirely
+    # checkMate and staleMate are left alone since quiet moves are never looked at
+    def getValidCaptures(self):
+        inCheck, pins, checks = self.checkForPinsAndChecks()
+        if self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        moves = self.getAllPossibleCaptures()
+        if len(checks) > 1: # double check, only king captures can help
+            moves = [move for move in moves if move.startRow == kingRow and move.startCol == kingCol]
+        return self.filterLegalMoves(moves, pins, checks, kingRow, kingCol)
+
+    # keeps the pseudo-legal moves that do not leave the king in check, using the pins and checks found from the king
+    def filterLegalMoves(self, moves, pins, checks, kingRow, kingCol):
+        pinDirections = {(pin[0], pin[1]): (pin[2], pin[3]) for pin in pins}
+        validSquares = None
+        if len(checks) == 1: # single check, block the check, capture the checker or move the king
+            checkRow, checkCol, dr, dc = checks[0]
+            if self.board[checkRow][checkCol][1] == 'N': # knight checks cannot be blocked
+                validSquares = {(checkRow, checkCol)}
+            else:
+                validSquares = set()
+                for i in range(1, 8):
+                    square = (kingRow + dr * i, kingCol + dc * i)
+                    validSquares.add(square)
+                    if square == (checkRow, checkCol):
+                        break
+        legalMoves = []
+        for move in moves:
+            if move.startRow == kingRow and move.startCol == kingCol:
+                if not self.kingMoveLeavesCheck(move):
+                    continue
+            elif move.isEnpassantMove:
+                if not self.enpassantIsLegal(move): # both pawns leave the board, so pins alone do not cover it
+                    continue
+            else:
+                pin = pinDirections.get((move.startRow, move.startCol))
+                if pin is not None and (move.endRow - move.startRow) * pin[1] != (move.endCol - move.startCol) * pin[0]:
+                    continue # pinned piece may only move along the pin
+                if validSquares is not None and (move.endRow, move.endCol) not in validSquares:
+                    continue
+            legalMoves.append(move)
+        return legalMoves
+
+    # returns if the player to move is in check, a list of pins and a list of checks
+    # pins and checks are (row, col, rowDirection, colDirection) looking outward from the king
+    def checkForPinsAndChecks(self):
+        pins = []
+        checks = []
+        inCheck = False
+        if self.whiteToMove:
+            enemyColor = "b"
+            allyColor = "w"
+            startRow, startCol = self.whiteKingLocation
+        else:
+            enemyColor = "w"
+            allyColor = "b"
+            startRow, startCol = self.blackKingLocation
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(len(directions)):
+            d = directions[j]
+            possiblePin = () # reset possible pins
+            for i in range(1, 8):
+                endRow = startRow + d[0] * i
+                endCol = startCol + d[1] * i
+                if 0 <= endRow < 8 and 0 <= endCol < 8: # on board
+                    endPiece = self.board[endRow][endCol]
+                    if endPiece[0] == allyColor:
+                        if possiblePin == (): # first allied piece could be pinned
+                            possiblePin = (endRow, endCol, d[0], d[1])
+                        else: # second allied piece, so no pin or check possible in this direction
+                            break
+                    elif endPiece[0] == enemyColor:
+                        pieceType = endPiece[1]
+                        # 1. orthogonally away from king and piece is a rook
+                        # 2. diagonally away from king and piece is a bishop
+                        # 3. one square diagonally away from king and piece is a pawn
+                        # 4. any direction and piece is a queen
+                        # 5. any direction one square away and piece is a king
+                        if (0 <= j <= 3 and pieceType == 'R') or \
+                                (4 <= j <= 7 and pieceType == 'B') or \
+                                (i == 1 and pieceType == 'p' and ((enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
+                                (pieceType == 'Q') or (i == 1 and pieceType == 'K'):
+                            if possiblePin == (): # no piece blocking, so check
+                                inCheck = True
+                                checks.append((endRow, endCol, d[0], d[1]))
+                            else: # piece blocking so pin
+                                pins.append(possiblePin)
+                        break # enemy piece is not applying a check or pin
+                else: # off board
+                    break
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        for m in knightMoves:
+            endRow = startRow + m[0]
+            endCol = startCol + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == enemyColor and endPiece[1] == 'N': # enemy knight attacking the king
+                    inCheck = True
+                    checks.append((endRow, endCol, m[0], m[1]))
+        return inCheck, pins, checks
+
+    # returns True if the king is safe on the end square of move
+    def kingMoveLeavesCheck(self, move):
+        enemyColor = "b" if self.whiteToMove else "w"
+        king = self.board[move.startRow][move.startCol]
+        self.board[move.startRow][move.startCol] = '--' # lift the king so sliders see through its old square
+        attacked = self.isSquareAttacked((move.endRow, move.endCol), enemyColor)
+        self.board[move.startRow][move.startCol] = king
+        return not attacked
+
+    # returns True if an en passant capture does not leave the king in check
+    def enpassantIsLegal(self, move):
+        capturedPawn = self.board[move.startRow][move.endCol]
+        self.board[move.startRow][move.startCol] = '--'
+        self.board[move.startRow][move.endCol] = '--'
+        self.board[move.endRow][move.endCol] = move.pieceMoved
+        attacked = self.inCheck()
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        self.board[move.startRow][move.endCol] = capturedPawn
+        self.board[move.endRow][move.endCol] = '--'
+        return not attacked
 
     # determine if current player is in check
     def inCheck(self):
         if self.whiteToMove:
-            return self.squareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
+            return self.isSquareAttacked(self.whiteKingLocation, "b")
         else:
-            return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
+            return self.isSquareAttacked(self.blackKingLocation, "w")
 
-    # determine if they can attack the square
+    # determine if the opponent can attack the square
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove # switch to opponents pov
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove # switch turn back
-        for move in oppMoves:
-          if move.endRow == r and move.endCol == c: # square is under attack
-              return True
+        return self.isSquareAttacked((r, c), "b" if self.whiteToMove else "w")
+
+    # returns True if any piece of byColor attacks square
+    # looks outward from the square and stops at the first attacker, no moves are generated
+    def isSquareAttacked(self, square, byColor):
+        r, c = square
+        board = self.board
+        knight = byColor + 'N'
+        for dr, dc in ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)):
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == knight:
+                return True
+        pawnRow = r + 1 if byColor == 'w' else r - 1 # white pawns attack upwards, so they sit one row below
+        if 0 <= pawnRow < 8:
+            pawn = byColor + 'p'
+            if (c > 0 and board[pawnRow][c-1] == pawn) or (c < 7 and board[pawnRow][c+1] == pawn):
+                return True
+        king = byColor + 'K'
+        for dr, dc in ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)):
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == king:
+                return True
+        queen = byColor + 'Q'
+        for directions, slider in ((((-1, 0), (0, -1), (1, 0), (0, 1)), byColor + 'R'),
+                                   (((-1, -1), (-1, 1), (1, -1), (1, 1)), byColor + 'B')):
+            for dr, dc in directions:
+                endRow = r + dr
+                endCol = c + dc
+                while 0 <= endRow < 8 and 0 <= endCol < 8:
+                    endPiece = board[endRow][endCol]
+                    if endPiece != "--":
+                        if endPiece == slider or endPiece == queen:
+                            return True
+                        break # first piece on the ray blocks it
+                    endRow += dr
+                    endCol += dc
         return False
+
+    # returns the squares of every piece attacking square, of both colors unless byColor is given
+    # used by static exchange evaluation and the evaluation terms that count attackers
+    def attackersOf(self, square, byColor=None):
+        r, c = square
+        board = self.board
+        attackers = []
+        for dr, dc in ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)):
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = board[endRow][endCol]
+                if endPiece[1] == 'N' and (byColor is None or endPiece[0] == byColor):
+                    attackers.append((endRow, endCol))
+        for color, pawnRow in (('w', r + 1), ('b', r - 1)):
+            if (byColor is None or color == byColor) and 0 <= pawnRow < 8:
+                for endCol in (c - 1, c + 1):
+                    if 0 <= endCol < 8 and board[pawnRow][endCol] == color + 'p':
+                        attackers.append((pawnRow, endCol))
+        for dr, dc in ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)):
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = board[endRow][endCol]
+                if endPiece[1] == 'K' and (byColor is None or endPiece[0] == byColor):
+                    attackers.append((endRow, endCol))
+        for directions, sliderType in ((((-1, 0), (0, -1), (1, 0), (0, 1)), 'R'),
+                                       (((-1, -1), (-1, 1), (1, -1), (1, 1)), 'B')):
+            for dr, dc in directions:
+                endRow = r + dr
+                endCol = c + dc
+                while 0 <= endRow < 8 and 0 <= endCol < 8:
+                    endPiece = board[endRow][endCol]
+                    if endPiece != "--":
+                        if (endPiece[1] == sliderType or endPiece[1] == 'Q') and (byColor is None or endPiece[0] == byColor):
+                            attackers.append((endRow, endCol))
+                        break
+                    endRow += dr
+                    endCol += dc
+        return attackers
     
     # all moves without considering checks
     def getAllPossibleMoves(self): 
@@ -229,6 +746,56 @@ class GameState():
         return moves
 
       
+    # all captures, en passant captures and promotions without considering checks
+    def getAllPossibleCaptures(self):
+        moves = []
+        if self.whiteToMove:
+            allyColor, enemyColor, forward, promotionRow = 'w', 'b', -1, 0
+        else:
+            allyColor, enemyColor, forward, promotionRow = 'b', 'w', 1, 7
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[0] != allyColor:
+                    continue
+                pieceType = piece[1]
+                if pieceType == 'p':
+                    endRow = r + forward
+                    if endRow == promotionRow and self.board[endRow][c] == "--": # pushing to promote
+                        moves.append(Move((r, c), (endRow, c), self.board))
+                    for endCol in (c - 1, c + 1):
+                        if 0 <= endCol < 8:
+                            if self.board[endRow][endCol][0] == enemyColor:
+                                moves.append(Move((r, c), (endRow, endCol), self.board))
+                            elif (endRow, endCol) == self.enpassantPossible:
+                                moves.append(Move((r, c), (endRow, endCol), self.board, isEnpassantMove=True))
+                elif pieceType == 'N' or pieceType == 'K':
+                    steps = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)) if pieceType == 'N' else \
+                            ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+                    for dr, dc in steps:
+                        endRow = r + dr
+                        endCol = c + dc
+                        if 0 <= endRow < 8 and 0 <= endCol < 8 and self.board[endRow][endCol][0] == enemyColor:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
+                else:
+                    directions = ()
+                    if pieceType != 'B':
+                        directions += ((-1, 0), (0, -1), (1, 0), (0, 1))
+                    if pieceType != 'R':
+                        directions += ((-1, -1), (-1, 1), (1, -1), (1, 1))
+                    for dr, dc in directions:
+                        endRow = r + dr
+                        endCol = c + dc
+                        while 0 <= endRow < 8 and 0 <= endCol < 8:
+                            endPiece = self.board[endRow][endCol]
+                            if endPiece != "--":
+                                if endPiece[0] == enemyColor: # only the first piece on the ray can be captured
+                                    moves.append(Move((r, c), (endRow, endCol), self.board))
+                                break
+                            endRow += dr
+                            endCol += dc
+        return moves
+
     # get all pawn moves at row col and then add these moves to the list
     def getPawnMoves(self, r, c, moves):
         if self.whiteToMove: # white pawn moves
@@ -258,7 +825,7 @@ class GameState():
                 elif (r+1, c-1) == self.enpassantPossible:
                     moves.append(Move((r, c), (r+1, c-1), self.board, isEnpassantMove=True))
             if c+1 <= 7: # don't go over the board
-                if self.board[r+1][c+1][0] == 'b': # enemy piece to capture
+                if self.board[r+1][c+1][0] == 'w': # enemy piece to capture
                     moves.append(Move((r, c), (r+1, c+1), self.board)) # to the right   
                 elif (r+1, c+1) == self.enpassantPossible:
                     moves.append(Move((r, c), (r+1, c+1), self.board, isEnpassantMove=True))
@@ -365,6 +932,11 @@ class CastleRights():
         self.wqs = wqs
         self.bqs = bqs
 
+# move IDs pack the start square into the low 6 bits and the end square into the next 6, squares numbered row * 8 + col
+# a8 to a8 would be 0, so 0 never names a real move; built once so every Move shares the same int objects
+packedMoveIDs = [[start | end << 6 for end in range(64)] for start in range(64)]
+
+
 class Move():
 
     # maps keys to values
@@ -375,27 +947,32 @@ class Move():
     rowsToRanks = {v: k for k, v in ranksToRows.items()} # reverses dictionary
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()} # reverses dictionary
-    
+
+    # fixed attributes and no per-instance dict, one is built for every generated move
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured',
+                 'isPawnPromotion', 'isEnpassantMove', 'isCastleMove', 'moveID')
 
     def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol] # empty string if no piece is there
+        self.startRow = startRow = startSq[0]
+        self.startCol = startCol = startSq[1]
+        self.endRow = endRow = endSq[0]
+        self.endCol = endCol = endSq[1]
+        self.pieceMoved = pieceMoved = board[startRow][startCol]
+        self.pieceCaptured = board[endRow][endCol] # empty string if no piece is there
         # pawn promotion below
-        self.isPawnPromotion = False
-        self.isPawnPromotion = ((self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7))
+        self.isPawnPromotion = (endRow == 0 and pieceMoved == 'wp') or (endRow == 7 and pieceMoved == 'bp')
         # en passant below
         self.isEnpassantMove = isEnpassantMove
-        #self.castle = castle
-        if self.isEnpassantMove == True:
-            self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
+        if isEnpassantMove:
+            self.pieceCaptured = 'wp' if pieceMoved == 'bp' else 'bp'
         # castle move
         self.isCastleMove = isCastleMove
-        self.isCapture = self.pieceCaptured != '--'
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow *10 + self.endCol
+        self.moveID = packedMoveIDs[startRow * 8 + startCol][endRow * 8 + endCol]
+
+    # worked out when asked for, most generated moves are never looked at
+    @property
+    def isCapture(self):
+        return self.pieceCaptured != '--'
 
     # over riding the equals method
     def __eq__(self, other):
@@ -403,7 +980,8 @@ class Move():
             return self.moveID == other.moveID
         return False
 
-  
+    def __hash__(self):
+        return self.moveID
 
     def getChessNotation(self):
       # can later make this real chess notation
@@ -426,4 +1004,23 @@ class Move():
         moveString = self.pieceMoved[1]
         if self.isCapture:
             moveString += 'x'
-        return moveString + endSquare
\ No newline at end of file
+        return moveString + endSquare
+
+
+backends = ('mailbox', 'bitboard')
+
+# the game state class for a backend, the CHESS_BACKEND environment variable picks it when none is given
+def gameStateClass(backend=None):
+    if backend is None:
+        backend = os.environ.get('CHESS_BACKEND', 'mailbox')
+    if backend == 'mailbox':
+        return GameState
+    if backend == 'bitboard':
+        import BitboardEngine # imported on demand, it builds its attack tables at import
+        return BitboardEngine.BitboardGameState
+    raise ValueError("unknown backend: " + backend)
+
+# creates a game state on the chosen backend, starting from the initial position unless a FEN string is passed
+def newGameState(backend=None, fen=None):
+    stateClass = gameStateClass(backend)
+    return stateClass() if fen is None else stateClass.fromFEN(fen)
@@ -0,0 +1,190 @@
+"""
+Batch analysis - searches every position of an EPD or FEN file on a process pool and writes one JSON line per position.
+Positions are read lazily and only a few per worker are in flight at once, so memory stays flat on million line inputs.
+Results come out in input order, each with its line number, which is what lets --resume pick up after the last
+position an interrupted run finished.
+
+    python batchAnalysis.py positions.epd --depth 4 --output results.jsonl
+    python batchAnalysis.py positions.epd --movetime 0.5 --workers 4 --output results.jsonl --resume
+    cat positions.fen | python batchAnalysis.py --nodes 20000
+
+Each output line holds line, fen, id (EPD only), bestmove, cp or mate, depth, nodes, time and pv,
+or line, fen and error when the line could not be read as a position or the search failed on it.
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import ChessEngine, chessAI, uci
+from transpositionTable import TranspositionTable
+
+TASKS_PER_WORKER = 4 # positions queued per worker, enough to keep every worker busy without reading ahead
+
+workerTable = None # the transposition table of this worker process, set up by initWorker
+workerBackend = None
+
+
+def initWorker(hashSizeMB, backend):
+    global workerTable, workerBackend
+    workerTable = TranspositionTable(hashSizeMB)
+    workerBackend = backend
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl-C is the parent's to handle, it closes the pool
+
+
+# splits an EPD or FEN line into (FEN, EPD operations), a line with numeric fifth and sixth fields is a plain FEN
+# EPD operations follow the first four fields as `opcode operand...;`, hmvc and fmvn fill in the move clocks
+def parsePositionLine(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError('not a FEN or EPD position: ' + line.strip())
+    rest = fields[4] if len(fields) > 4 else ''
+    clocks = rest.split()
+    if len(clocks) == 2 and clocks[0].isdigit() and clocks[1].isdigit():
+        return line.strip(), {}
+    operations = {}
+    for operation in rest.split(';'):
+        operation = operation.strip()
+        if operation:
+            opcode, _, operand = operation.partition(' ')
+            operations[opcode] = operand.strip().strip('"')
+    fen = ' '.join(fields[:4] + [operations.get('hmvc', '0'), operations.get('fmvn', '1')])
+    return fen, operations
+
+
+# lazily yields (line number, text) for every position line, blank lines and # comments are skipped
+# line numbers start at 1 and count every line of the input, so they stay the same from one run to the next
+def readPositions(lines, skipThrough=0):
+    for lineNumber, text in enumerate(lines, 1):
+        if lineNumber <= skipThrough:
+            continue
+        text = text.strip()
+        if text and not text.startswith('#'):
+            yield lineNumber, text
+
+
+# searches one position in a worker and returns its output record
+def analysePosition(task):
+    lineNumber, text, depth, movetime, nodes = task
+    record = {'line': lineNumber}
+    try:
+        fen, operations = parsePositionLine(text)
+        gs = ChessEngine.gameStateClass(workerBackend).fromFEN(fen)
+    except ValueError as error:
+        record['fen'] = text
+        record['error'] = str(error)
+        return record
+    record['fen'] = fen
+    if 'id' in operations:
+        record['id'] = operations['id']
+    try:
+        record.update(searchPosition(gs, depth, movetime, nodes))
+    except Exception as error: # a position the engine fails on gets its error record, the rest of the batch carries on
+        record['error'] = '%s: %s' % (type(error).__name__, error)
+    return record
+
+
+# the result fields of the record for gs
+def searchPosition(gs, depth, movetime, nodes):
+    validMoves = gs.getValidMoves()
+    if not validMoves: # nothing to search, the game is already over
+        return {'bestmove': None, 'mate' if gs.checkMate else 'cp': 0}
+    # a cleared table and fresh move ordering tables, so a position scores the same whatever ran before it
+    workerTable.clear()
+    result = chessAI.Searcher(workerTable).search(gs, validMoves, depth, movetime, nodes)
+    kind, value = uci.uciScore(result.score, result.pv).split()
+    return {'bestmove': None if result.bestMove is None else uci.uciMove(result.bestMove), # None when a tiny limit stopped depth 1
+            kind: int(value), 'depth': result.depth, 'nodes': result.nodes, 'time': round(result.time, 3),
+            'pv': [uci.uciMove(move) for move in result.pv]}
+
+
+# line number of the last record in a results file, dropping a last line the interrupted run only half wrote
+def lastFinishedLine(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        # walk back from the end in blocks until the last complete line is found
+        position = end
+        tail = b''
+        while position > 0 and tail.count(b'\n') < 2:
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+        if tail and not tail.endswith(b'\n'):
+            cut = tail.rfind(b'\n') + 1
+            f.truncate(position + cut)
+            tail = tail[:cut]
+        lines = tail.splitlines()
+    if not lines:
+        return 0
+    return json.loads(lines[-1])['line']
+
+
+# yields the output records in input order, keeping at most maxPending positions queued on the pool
+def analyseStream(pool, positions, depth=None, movetime=None, nodes=None, maxPending=8):
+    pending = collections.deque()
+    for lineNumber, text in positions:
+        pending.append(pool.apply_async(analysePosition, ((lineNumber, text, depth, movetime, nodes),)))
+        if len(pending) >= maxPending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+# analyses every position in lines and writes the records to output, returns the number of positions analysed
+def analyseFile(lines, output, depth=None, movetime=None, nodes=None, workers=None, hashSizeMB=chessAI.HASH_SIZE_MB,
+                backend='mailbox', skipThrough=0):
+    if depth is None and movetime is None and nodes is None:
+        depth = chessAI.DEPTH
+    workers = workers or os.cpu_count() or 1
+    count = 0
+    with multiprocessing.Pool(workers, initWorker, (hashSizeMB, backend)) as pool:
+        for record in analyseStream(pool, readPositions(lines, skipThrough), depth, movetime, nodes,
+                                    workers * TASKS_PER_WORKER):
+            output.write(json.dumps(record) + '\n')
+            output.flush() # a record on disk is a position a resumed run will not search again
+            count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search every position of an EPD or FEN file and write JSONL results')
+    parser.add_argument('input', nargs='?', help='EPD or FEN file, one position per line (default: stdin)')
+    parser.add_argument('--output', help='JSONL results file (default: stdout)')
+    parser.add_argument('--resume', action='store_true', help='append to --output, skipping the positions it already has')
+    parser.add_argument('--depth', type=int)
+    parser.add_argument('--movetime', type=float, help='seconds per position')
+    parser.add_argument('--nodes', type=int)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--hash', type=int, default=chessAI.HASH_SIZE_MB, help='transposition table MB per worker')
+    parser.add_argument('--backend', default='mailbox', choices=ChessEngine.backends)
+    args = parser.parse_args(argv)
+    if args.resume and args.output is None:
+        parser.error('--resume needs --output')
+
+    skipThrough = lastFinishedLine(args.output) if args.resume else 0
+    lines = open(args.input) if args.input else sys.stdin
+    output = open(args.output, 'a' if args.resume else 'w') if args.output else sys.stdout
+    try:
+        count = analyseFile(lines, output, args.depth, args.movetime, args.nodes, args.workers, args.hash,
+                            args.backend, skipThrough)
+    except KeyboardInterrupt: # everything written so far is complete, --resume carries on from there
+        return 130
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        if output is not sys.stdout:
+            output.close()
+    print('analysed %d positions' % count + (' (resumed after line %d)' % skipThrough if skipThrough else ''),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,67 +1,39 @@
+import asyncio
+import functools
+import math
 import random
-
-pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1}
-
-knightScore = [[1, 1, 1, 1, 1, 1, 1, 1],
-              [1, 2, 2, 2, 2, 2, 2, 1],
-              [1, 2, 3, 3, 3, 3, 2, 1],
-              [1, 2, 3, 4, 4, 3, 2, 1],
-              [1, 2, 3, 4, 4, 3, 2, 1],
-              [1, 2, 3, 3, 3, 3, 2, 1],
-              [1, 2, 2, 2, 2, 2, 2, 1],
-              [1, 1, 1, 1, 1, 1, 1, 1]] # finding best knight position
-
-bishopScores = [[4, 3, 2, 1, 1, 2, 3, 4],
-               [3, 4, 3, 2, 2, 3, 4, 3],
-               [2, 3, 4, 3, 3, 4, 3, 2],
-               [1, 2, 3, 4, 4, 3, 2, 1],
-               [1, 2, 3, 4, 4, 3, 2, 1],
-               [2, 3, 4, 3, 3, 4, 3, 2],
-               [3, 4, 3, 2, 2, 3, 4, 3],
-               [4, 3, 2, 1, 1, 2, 3, 4]]
-
-queenScores = [[1, 1, 1, 3, 1, 1, 1, 1],
-              [1, 2, 3, 3, 3, 1, 1, 1],
-              [1, 4, 3, 3, 3, 2, 2, 1],
-              [1, 2, 3, 3, 3, 2, 2, 1],
-              [1, 2, 3, 3, 3, 2, 2, 1],
-              [1, 4, 3, 3, 3, 2, 2, 1],
-              [1, 1, 1, 3, 1, 1, 1, 1],
-              [1, 1, 1, 3, 1, 1, 1, 1]]
-
-rookScores = [[4, 3, 4, 4, 4, 4, 3, 4],
-             [4, 4, 4, 4, 4, 4, 4, 4],
-             [1, 1, 2, 3, 3, 2, 1, 1],
-             [1, 2, 3, 4, 4, 3, 2, 1],
-             [1, 2, 3, 4, 4, 3, 2, 1],
-             [1, 1, 2, 2, 2, 2, 1, 1],
-             [4, 4, 4, 4, 4, 4, 4, 4],
-             [4, 3, 4, 4, 4, 4, 3, 4]]
-
-whitePawnScores = [[8, 8, 8, 8, 8, 8, 8, 8],
-                  [8, 8, 8, 8, 8, 8, 8, 8],
-                  [5, 6, 6, 7, 7, 6, 6, 5],
-                  [2, 3, 3, 4, 4, 3, 2 ,1],
-                  [1, 2, 3, 4, 4, 3, 2, 1],
-                  [1, 1, 2, 3, 3, 2, 1, 1],
-                  [1, 1, 1, 0, 0, 1, 1, 1],
-                  [0, 0, 0, 0, 0, 0, 0, 0]]
-
-blackPawnScores = [[0, 0, 0, 0, 0, 0, 0, 0],
-                  [1, 1, 1, 0, 0, 1, 1, 1],
-                  [1, 1, 2, 3, 3, 2, 1, 1],
-                  [1, 2, 3, 4, 4, 3, 2, 1],
-                  [2, 3, 3, 4, 4, 3, 2 ,1],
-                  [5, 6, 6, 7, 7, 6, 6, 5],
-                  [8, 8, 8, 8, 8, 8, 8, 8],
-                  [8, 8, 8, 8, 8, 8, 8, 8]]
-
-piecePositionScores = {"N": knightScore, "Q": queenScores, "B": bishopScores, "R": rookScores, "bp": blackPawnScores, "wp": whitePawnScores}
+import threading
+import time
+from transpositionTable import TranspositionTable, EXACT, LOWERBOUND, UPPERBOUND
+from evaluationTables import pieceScore, knightScore, bishopScores, queenScores, rookScores, whitePawnScores, blackPawnScores, piecePositionScores
 
 
 CHECKMATE = 1000
 STALEMATE = 0
+DRAW = 0 # repetitions and the fifty-move rule
 DEPTH = 2
+HASH_SIZE_MB = 16
+MAX_DEPTH = 64 # iterative deepening stops here when only a time or node limit is given
+DELTA_MARGIN = 2 # quiescence skips captures that cannot lift the score to alpha even with this much to spare
+NULL_WINDOW = 0.01 # width of the zero windows PVS tests moves with, below the 0.1 step between two evaluations
+NULL_MOVE_MIN_DEPTH = 3 # null-move pruning only where at least this much depth is left
+NULL_MOVE_REDUCTION = 3 # how much shallower the search after the pass is, one more from depth 7
+LMR_MIN_DEPTH = 3 # late move reductions likewise
+LMR_FULL_MOVES = 2 # moves searched to full depth before quiet ones are reduced
+ASPIRATION_MIN_DEPTH = 3 # iterations from this depth search a window around the last score first
+ASPIRATION_WINDOW = 0.5 # pawns either side of the last score, widened fourfold on every fail
+# plies a late quiet move is reduced by, by depth left and move number - more the deeper and the later, and never
+# straight into the quiescence search
+lateMoveReductions = [[max(0, min(depth - 2, int(1 + math.log(max(depth, 1)) * math.log(max(moveNumber, 1)) / 1.5)))
+                       for moveNumber in range(64)] for depth in range(MAX_DEPTH + 1)]
+TABLEBASE_WIN = 500 # a tablebase win n plies from the root scores this minus n, above any evaluation and below CHECKMATE
+MAX_TABLEBASE_PLIES = 250 # scores within this of TABLEBASE_WIN are tablebase results
+
+transpositionTable = TranspositionTable(HASH_SIZE_MB) # kept between calls to findBestMove
+
+# resizes the transposition table, which also clears it
+def setHashSize(sizeMB):
+    transpositionTable.resize(sizeMB)
 
 # picks and returns a random move
 def findRandomMove(validMoves):
@@ -106,99 +78,547 @@ def findBestMoveMinMaxNoRecursion(gs, validMoves):
 
 
 
-def findBestMove(gs, validMoves):
-    global nextMove, counter
-    nextMove = None
-    counter = 0
-    # findMoveMinMax(gs, validMoves, DEPTH, gs.whiteToMove)
-    # findMoveNegaMax(gs, validMoves, DEPTH, 1 if gs.whiteToMove else -1)
-    findMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    print(counter)
-    return nextMove
+# move ordering - hash or PV move, captures by MVV-LVA, promotions, two killer moves per ply, then quiet moves by history
+HASH_MOVE_ORDER = 10000000
+CAPTURE_ORDER = 1000000
+PROMOTION_ORDER = 900000
+KILLER_ORDER = 800000
+HISTORY_LIMIT = 700000 # history scores are halved once one passes this, so quiet moves never outrank killers
 
-  
-# MinMax algorithm with recursion 
-def findMoveMinMax(gs, validMoves, depth, whiteToMove):
-    global nextMove, counter
-    counter += 1
-    if depth == 0: # at deepest I want to go
-        return scoreMaterial(gs.board)
-
-    if whiteToMove: 
-        maxScore = -CHECKMATE  
-        for move in validMoves:
+
+# most valuable victim first, least valuable attacker breaks ties - a legal king capture is always safe
+def captureOrder(move):
+    victimValue = pieceScore[move.pieceCaptured[1]] if move.isCapture else 0
+    if move.isPawnPromotion:
+        victimValue += pieceScore['Q'] - pieceScore['p']
+    return 10 * victimValue - pieceScore[move.pieceMoved[1]]
+
+
+# raised inside the search when the time or node budget runs out
+class SearchAborted(Exception):
+    pass
+
+
+# what one search found - the best move, its score from the side to move's point of view, the depth reached,
+# node counts, time taken in seconds and the principal variation as a list of Moves
+class SearchResult():
+    def __init__(self, bestMove, score, depth, nodes, quiescenceNodes, elapsed, pv, firstMoveCutoffRate, stopped):
+        self.bestMove = bestMove
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.quiescenceNodes = quiescenceNodes
+        self.time = elapsed
+        self.pv = pv
+        self.firstMoveCutoffRate = firstMoveCutoffRate # near 1 means the ordering finds the refutation first
+        self.stopped = stopped # True when Searcher.stop cut the search short
+        self.stats = None # a searchStats.SearchStats when the Searcher is instrumented
+
+    def nodesPerSecond(self):
+        return self.nodes / self.time if self.time > 0 else 0.0
+
+    def pvNotation(self):
+        return [move.getChessNotation() for move in self.pv]
+
+
+# one search context - limits, statistics, principal variation, the killer and history tables and the stop flag
+# all live here, so any number of Searchers can run at once in threads or asyncio tasks as long as each has its own
+# GameState; give each its own transposition table too, the table is not safe to write from two threads
+class Searcher():
+    def __init__(self, table=None):
+        self.transpositionTable = TranspositionTable(HASH_SIZE_MB) if table is None else table
+        self.killerMoves = [[0, 0] for _ in range(MAX_DEPTH + 2)] # moveIDs of quiet moves that caused a cutoff at each ply
+        self.historyTable = {color + piece: [0] * 64 for color in 'wb' for piece in 'pNBRQK'} # cutoff credit by piece and end square
+        self.principalVariation = []
+        self.pvTable = [[] for _ in range(MAX_DEPTH + 2)]
+        self.stopRequested = False
+        self.rootDepth = 0
+        self.depthLimit = 0
+        self.onIteration = None # called with a SearchResult after every finished depth when set
+        self.book = None # an openingBook.OpeningBook, a book move is played without searching
+        self.bookMode = 'weighted' # or 'best', see OpeningBook.chooseMove
+        self.tablebases = None # a tablebase.Tablebases, positions it covers below the root are scored exactly
+        self.instrumentation = None # a searchStats.Instrumentation, which adds statistics to every SearchResult
+        self.evaluate = scoreBoard # static evaluation and exchange evaluation, per Searcher so instrumentation can wrap them
+        self.staticExchange = staticExchangeEvaluation
+        self.pruning = True # PVS, null-move pruning, late move reductions and aspiration windows - off searches every move full width
+
+    # asks a running search to finish, it returns the best move of the last finished depth within a few nodes
+    # safe to call from another thread
+    def stop(self):
+        self.stopRequested = True
+
+    # turns a running infinite search, such as one pondering the expected reply, into a normal one with these limits
+    # its transposition table, move ordering tables and finished depths carry straight on
+    def ponderhit(self, depth=None, movetime=None):
+        if movetime is not None:
+            self.stopTime = time.perf_counter() + movetime
+        if depth is not None:
+            self.depthLimit = depth
+            if self.rootDepth > depth: # already past the depth asked for, the finished depths are enough
+                self.stop()
+
+    def findBestMove(self, gs, validMoves, depth=None, movetime=None, nodes=None):
+        return self.search(gs, validMoves, depth, movetime, nodes).bestMove
+
+    # starts a search on a new thread and returns the thread, onResult is called on it with the SearchResult
+    # stop cancels the search from any thread
+    def searchInBackground(self, gs, validMoves, onResult, depth=None, movetime=None, nodes=None, infinite=False):
+        self.startSearch(depth, movetime, nodes, infinite)
+        thread = threading.Thread(target=lambda: onResult(self.iterativeDeepening(gs, validMoves)), daemon=True)
+        thread.start()
+        return thread
+
+    # runs search in a worker thread so the event loop stays free, cancelling the awaiting task stops the search
+    # and waits for it to put gs back the way it was
+    async def searchAsync(self, gs, validMoves, depth=None, movetime=None, nodes=None):
+        self.startSearch(depth, movetime, nodes)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, functools.partial(self.iterativeDeepening, gs, validMoves))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            self.stop()
+            await future
+            raise
+
+    # movetime is in seconds, nodes counts searched positions; with no limits it searches to DEPTH
+    # unless infinite is set, then it runs until stop or ponderhit
+    # alpha and beta narrow the root window, a score outside it is only a bound
+    def search(self, gs, validMoves, depth=None, movetime=None, nodes=None, alpha=-CHECKMATE, beta=CHECKMATE, infinite=False):
+        self.startSearch(depth, movetime, nodes, infinite)
+        return self.iterativeDeepening(gs, validMoves, alpha, beta)
+
+    # sets the limits and clears the stop flag for the next search
+    # done on the caller's thread before a background search starts, so a stop or ponderhit straight after is not lost
+    def startSearch(self, depth=None, movetime=None, nodes=None, infinite=False):
+        if depth is None and movetime is None and nodes is None and not infinite:
+            depth = DEPTH
+        self.startTime = time.perf_counter()
+        self.stopTime = None if movetime is None else self.startTime + movetime
+        self.nodeLimit = nodes
+        self.depthLimit = MAX_DEPTH if depth is None else depth # ponderhit can lower it while the search runs
+        self.stopOnForcedMove = depth is None and not infinite
+        self.rootDepth = 0
+        self.stopRequested = False
+
+    # searches depth 1, 2, 3... until a limit set by startSearch is hit or stop is called
+    # and returns a SearchResult holding the best move of the last finished depth - or a depth 0 one holding the book move
+    def iterativeDeepening(self, gs, validMoves, alpha=-CHECKMATE, beta=CHECKMATE):
+        if self.instrumentation is not None:
+            return self.instrumentation.run(self, gs, validMoves, alpha, beta)
+        return self.searchIterations(gs, validMoves, alpha, beta)
+
+    def searchIterations(self, gs, validMoves, alpha=-CHECKMATE, beta=CHECKMATE):
+        if self.book is not None:
+            bookMove = self.book.chooseMove(gs, validMoves, self.bookMode)
+            if bookMove is not None:
+                return SearchResult(bookMove, 0, 0, 0, 0, time.perf_counter() - self.startTime, [bookMove], 0.0, False)
+        self.counter = 0
+        self.rootPly = len(gs.moveLog)
+        self.rootPieces = sum(piece != '--' for row in gs.board for piece in row)
+        self.principalVariation = []
+        self.pvTable = [[] for _ in range(MAX_DEPTH + 2)]
+        self.killerMoves = [[0, 0] for _ in range(MAX_DEPTH + 2)]
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.quiescenceNodes = 0
+        self.ageHistory()
+        self.transpositionTable.newSearch()
+        turnMultiplier = 1 if gs.whiteToMove else -1
+        bestMove = None
+        bestScore = 0
+        completedDepth = 0
+        for self.rootDepth in range(1, MAX_DEPTH + 1):
+            if self.rootDepth > self.depthLimit:
+                break
+            self.nextMove = None
+            try:
+                # self.findMoveMinMax(gs, validMoves, self.rootDepth, gs.whiteToMove)
+                # self.findMoveNegaMax(gs, validMoves, self.rootDepth, turnMultiplier)
+                score = self.searchRoot(gs, validMoves, alpha, beta, bestScore, turnMultiplier)
+            except SearchAborted:
+                while len(gs.moveLog) > self.rootPly: # unwind the moves the aborted search left on the board
+                    if gs.moveLog[-1] is None:
+                        gs.undoNullMove()
+                    else:
+                        gs.undoMove()
+                if bestMove is None: # not even depth 1 finished, the best root move so far is better than nothing
+                    bestMove = self.nextMove
+                break
+            bestMove = self.nextMove
+            bestScore = score
+            completedDepth = self.rootDepth
+            self.principalVariation = self.extendPrincipalVariation(gs, self.pvTable[0], self.rootDepth) # searched first at every ply of the next iteration
+            if self.onIteration is not None:
+                self.onIteration(self.currentResult(bestMove, bestScore, completedDepth))
+            if abs(score) >= CHECKMATE or (len(validMoves) <= 1 and self.stopOnForcedMove): # deeper searches cannot change a forced mate or a forced move
+                break
+        return self.currentResult(bestMove, bestScore, completedDepth)
+
+    # one iteration at the root - from ASPIRATION_MIN_DEPTH on, a window around the last score is tried first and
+    # widened on whichever side the score falls outside it, as a narrow window cuts off much more
+    def searchRoot(self, gs, validMoves, alpha, beta, lastScore, turnMultiplier):
+        if not self.pruning or self.rootDepth < ASPIRATION_MIN_DEPTH or abs(lastScore) >= TABLEBASE_WIN - MAX_TABLEBASE_PLIES:
+            return self.findMoveNegaMaxAlphaBeta(gs, validMoves, self.rootDepth, alpha, beta, turnMultiplier)
+        window = ASPIRATION_WINDOW
+        low, high = max(alpha, lastScore - window), min(beta, lastScore + window)
+        while True:
+            score = self.findMoveNegaMaxAlphaBeta(gs, validMoves, self.rootDepth, low, high, turnMultiplier)
+            if score <= low and low > alpha:
+                window *= 4
+                low = max(alpha, lastScore - window)
+            elif score >= high and high < beta:
+                window *= 4
+                high = min(beta, lastScore + window)
+            else:
+                return score
+
+    def currentResult(self, bestMove, score, depth):
+        return SearchResult(bestMove, score, depth, self.counter, self.quiescenceNodes,
+                            time.perf_counter() - self.startTime, self.principalVariation,
+                            self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0, self.stopRequested)
+
+    # a table hit ends the principal variation early, so follow the stored best moves past it
+    def extendPrincipalVariation(self, gs, pv, maxLength):
+        pv = list(pv)
+        for move in pv:
             gs.makeMove(move)
-            nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth-1, False)
-            if score > maxScore:
+        while len(pv) < maxLength:
+            entry = self.transpositionTable.probe(gs.zobristKey)
+            if entry is None or entry[3] == 0:
+                break
+            move = None
+            for validMove in gs.getValidMoves():
+                if validMove.moveID == entry[3]:
+                    move = validMove
+                    break
+            if move is None:
+                break
+            gs.makeMove(move)
+            pv.append(move)
+        for _ in pv:
+            gs.undoMove()
+        return pv
+
+    def orderMoves(self, validMoves, firstMoveID, ply):
+        killers = self.killerMoves[ply]
+        historyTable = self.historyTable
+        def moveOrder(move):
+            if move.moveID == firstMoveID:
+                return HASH_MOVE_ORDER
+            if move.isCapture:
+                return CAPTURE_ORDER + captureOrder(move)
+            if move.isPawnPromotion:
+                return PROMOTION_ORDER
+            if move.moveID == killers[0]:
+                return KILLER_ORDER + 1
+            if move.moveID == killers[1]:
+                return KILLER_ORDER
+            return historyTable[move.pieceMoved][move.endRow * 8 + move.endCol]
+        validMoves.sort(key=moveOrder, reverse=True)
+
+    # remembers a quiet move that caused a beta cutoff as a killer and credits it in the history table
+    def recordQuietCutoff(self, move, depth, ply):
+        killers = self.killerMoves[ply]
+        if killers[0] != move.moveID:
+            killers[1] = killers[0]
+            killers[0] = move.moveID
+        history = self.historyTable[move.pieceMoved]
+        square = move.endRow * 8 + move.endCol
+        history[square] += depth * depth
+        if history[square] > HISTORY_LIMIT:
+            self.ageHistory()
+
+    # halves every history score so old cutoffs count for less than new ones
+    def ageHistory(self):
+        for scores in self.historyTable.values():
+            for i in range(64):
+                scores[i] //= 2
+
+    # negaMax including alpha-beta pruning
+    # validMoves can be None below the root, the moves are then generated only once the table has not cut off
+    def findMoveNegaMaxAlphaBeta(self, gs, validMoves, depth, alpha, beta, turnMultiplier):
+        self.counter += 1
+        if self.stopRequested or (self.nodeLimit is not None and self.counter > self.nodeLimit) or \
+                (self.stopTime is not None and self.counter % 64 == 0 and time.perf_counter() > self.stopTime):
+            raise SearchAborted()
+        ply = len(gs.moveLog) - self.rootPly
+        pvTable = self.pvTable
+        pvTable[ply] = []
+        # below the root a position seen before is scored as a draw - if repeating it was good, it can be repeated again
+        if ply > 0 and gs.halfmoveClock >= 4:
+            if gs.repetitionCount():
+                return DRAW
+            if gs.halfmoveClock >= 100: # unless the last move mated
+                if validMoves is None:
+                    validMoves = gs.getValidMoves()
+                if not gs.checkMate:
+                    return DRAW
+        # every ply takes at most one piece off, so the board is only scanned once few enough can be left
+        if self.tablebases is not None and ply > 0 and self.rootPieces - ply <= self.tablebases.maxPieces:
+            entry = self.tablebases.probe(gs)
+            if entry is not None:
+                result, plies = entry
+                if result == 0:
+                    return DRAW
+                if plies == 0:
+                    return -CHECKMATE
+                return result * (TABLEBASE_WIN - ply - plies)
+        if depth == 0:
+            return self.quiescenceSearch(gs, alpha, beta, turnMultiplier)
+        # a stored result at least as deep can narrow the window or cut off, except at the root which has to pick nextMove
+        alphaOriginal = alpha
+        hashMoveID = 0
+        entry = self.transpositionTable.probe(gs.zobristKey)
+        if entry is not None:
+            entryDepth, entryScore, entryBound, hashMoveID = entry
+            entryScore = scoreFromTable(entryScore, ply)
+            if entryDepth >= depth and depth != self.rootDepth:
+                if entryBound == EXACT:
+                    return entryScore
+                elif entryBound == LOWERBOUND:
+                    alpha = max(alpha, entryScore)
+                else:
+                    beta = min(beta, entryScore)
+                if alpha >= beta:
+                    return entryScore
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        if not validMoves:
+            return STALEMATE if gs.staleMate else -CHECKMATE
+        inCheck = depth >= min(NULL_MOVE_MIN_DEPTH, LMR_MIN_DEPTH) and self.pruning and gs.inCheck()
+        # null-move pruning - if passing the turn still scores at least beta in a shallower search, a real move would
+        # too; not in check, not straight after another pass and not without pieces, where zugzwang makes passing best
+        if self.pruning and ply > 0 and depth >= NULL_MOVE_MIN_DEPTH and not inCheck and gs.moveLog[-1] is not None \
+                and abs(beta) < TABLEBASE_WIN - MAX_TABLEBASE_PLIES and turnMultiplier * self.evaluate(gs) >= beta \
+                and hasPieces(gs):
+            reducedDepth = depth - 1 - NULL_MOVE_REDUCTION - (depth >= 7)
+            gs.makeNullMove()
+            score = -self.findMoveNegaMaxAlphaBeta(gs, None, max(reducedDepth, 0), -beta, -beta + NULL_WINDOW,
+                                                   -turnMultiplier)
+            gs.undoNullMove()
+            if score >= beta:
+                return beta if score >= TABLEBASE_WIN - MAX_TABLEBASE_PLIES else score # an unproven mate
+        # along the previous iteration's principal variation its move goes first, elsewhere the stored best move does
+        firstMoveID = hashMoveID
+        principalVariation = self.principalVariation
+        if ply < len(principalVariation) and all(gs.moveLog[self.rootPly + i] == principalVariation[i] for i in range(ply)):
+            firstMoveID = principalVariation[ply].moveID
+        self.orderMoves(validMoves, firstMoveID, ply)
+        maxScore = -CHECKMATE
+        bestMoveID = 0
+        killers = self.killerMoves[ply]
+        for moveNumber, move in enumerate(validMoves):
+            gs.makeMove(move)
+            if moveNumber == 0 or not self.pruning:
+                score = -self.findMoveNegaMaxAlphaBeta(gs, None, depth-1, -beta, -alpha, -turnMultiplier)
+            else:
+                # PVS - the first move is expected to be best, so the others only have to be shown no better with a
+                # zero window; late quiet moves are tested at reduced depth first
+                reduction = 0
+                if depth >= LMR_MIN_DEPTH and moveNumber >= LMR_FULL_MOVES and not inCheck and not move.isCapture \
+                        and not move.isPawnPromotion and move.moveID not in killers and not gs.inCheck():
+                    reduction = lateMoveReductions[depth][min(moveNumber, 63)]
+                score = -self.findMoveNegaMaxAlphaBeta(gs, None, depth-1-reduction, -alpha - NULL_WINDOW, -alpha,
+                                                       -turnMultiplier)
+                if score > alpha and reduction: # the reduced search was wrong about it, look again at full depth
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, None, depth-1, -alpha - NULL_WINDOW, -alpha,
+                                                           -turnMultiplier)
+                if alpha < score < beta: # better than the first move after all, its exact score needs the full window
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, None, depth-1, -beta, -alpha, -turnMultiplier)
+            if score > maxScore or (depth == self.rootDepth and self.nextMove is None): # a lost root still needs a move
                 maxScore = score
-                if depth == DEPTH: 
-                    nextMove = move 
+                bestMoveID = move.moveID
+                if depth == self.rootDepth:
+                    self.nextMove = move
+                if score > alpha: # inside the window, so this move extends the principal variation
+                    pvTable[ply] = [move] + pvTable[ply + 1]
+
+            gs.undoMove()
+            if maxScore > alpha: # pruning happens
+                alpha = maxScore
+            if alpha >= beta:
+                self.cutoffs += 1
+                if moveNumber == 0:
+                    self.firstMoveCutoffs += 1
+                if not move.isCapture and not move.isPawnPromotion:
+                    self.recordQuietCutoff(move, depth, ply)
+                break
+
+        if maxScore <= alphaOriginal:
+            bound = UPPERBOUND
+        elif maxScore >= beta:
+            bound = LOWERBOUND
+        else:
+            bound = EXACT
+        self.transpositionTable.store(gs.zobristKey, depth, scoreToTable(maxScore, ply), bound, bestMoveID)
+        return maxScore
+
+    # searches captures and promotions only until the position is quiet, so leaves are never scored mid-exchange
+    # stand pat - the side to move can always decline to capture, so the static score is a lower bound
+    def quiescenceSearch(self, gs, alpha, beta, turnMultiplier):
+        self.counter += 1
+        self.quiescenceNodes += 1
+        if self.stopRequested or (self.nodeLimit is not None and self.counter > self.nodeLimit) or \
+                (self.stopTime is not None and self.counter % 64 == 0 and time.perf_counter() > self.stopTime):
+            raise SearchAborted()
+        inCheck = gs.inCheck()
+        if inCheck: # every evasion has to be searched, standing pat is not an option
+            moves = gs.getValidMoves()
+            if len(moves) == 0:
+                return -CHECKMATE
+            standPat = -CHECKMATE
+            maxScore = -CHECKMATE
+        else:
+            standPat = turnMultiplier * self.evaluate(gs)
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            maxScore = standPat
+            moves = gs.getValidCaptures()
+        moves.sort(key=captureOrder, reverse=True)
+        for move in moves:
+            if not inCheck:
+                gain = pieceScore[move.pieceCaptured[1]] if move.isCapture else 0
+                if move.isPawnPromotion:
+                    gain += pieceScore['Q'] - pieceScore['p']
+                if standPat + gain + DELTA_MARGIN <= alpha: # delta pruning, even winning the piece for free cannot reach alpha
+                    continue
+                if move.isCapture and pieceScore[move.pieceMoved[1]] > pieceScore[move.pieceCaptured[1]] \
+                        and self.staticExchange(gs, move) < 0: # losing capture
+                    continue
+            gs.makeMove(move)
+            score = -self.quiescenceSearch(gs, -beta, -alpha, -turnMultiplier)
             gs.undoMove()
+            if score > maxScore:
+                maxScore = score
+            if maxScore > alpha:
+                alpha = maxScore
+            if alpha >= beta:
+                break
         return maxScore
-            
-    else:
-        minScore = CHECKMATE 
+
+    # MinMax algorithm with recursion
+    def findMoveMinMax(self, gs, validMoves, depth, whiteToMove):
+        self.counter += 1
+        if depth == 0: # at deepest I want to go
+            return scoreMaterial(gs.board)
+
+        if whiteToMove:
+            maxScore = -CHECKMATE
+            for move in validMoves:
+                gs.makeMove(move)
+                nextMoves = gs.getValidMoves()
+                score = self.findMoveMinMax(gs, nextMoves, depth-1, False)
+                if score > maxScore:
+                    maxScore = score
+                    if depth == self.rootDepth:
+                        self.nextMove = move
+                gs.undoMove()
+            return maxScore
+
+        else:
+            minScore = CHECKMATE
+            for move in validMoves:
+                gs.makeMove(move)
+                nextMoves = gs.getValidMoves()
+                score = self.findMoveMinMax(gs, nextMoves, depth -1, True)
+                if score < minScore:
+                    minScore = score
+                    if depth == self.rootDepth:
+                        self.nextMove = move
+                gs.undoMove()
+            return minScore
+
+    # negaMax algorithm with recursion
+    def findMoveNegaMax(self, gs, validMoves, depth, turnMultiplier):
+        self.counter += 1
+        if depth == 0:
+            return turnMultiplier * self.evaluate(gs)
+        maxScore = -CHECKMATE
         for move in validMoves:
             gs.makeMove(move)
             nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth -1, True)
-            if score < minScore:
-                minScore = score
-                if depth == DEPTH: 
-                    nextMove = move 
+            score = -self.findMoveNegaMax(gs, nextMoves, depth-1, -turnMultiplier)
+            if score > maxScore:
+                maxScore = score
+                if depth == self.rootDepth:
+                    self.nextMove = move
             gs.undoMove()
-        return minScore
-    
-# negaMax algorithm with recursion
-def findMoveNegaMax(gs, validMoves, depth, turnMultiplier):
-    global nextMove, counter
-    counter += 1
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-    random.shuffle(validMoves)
-    maxScore = -CHECKMATE
-    for move in validMoves:
-        gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMax(gs, nextMoves, depth-1, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-              
-        gs.undoMove()
-    return maxScore
+        return maxScore
+
+
+# searches with the default Searcher - use a Searcher of your own for the SearchResult or to run searches concurrently
+def findBestMove(gs, validMoves, depth=None, movetime=None, nodes=None):
+    return defaultSearcher.findBestMove(gs, validMoves, depth, movetime, nodes)
+
+
+# a tablebase score counts plies from the root, which differs from one path to a position to the next, so the table
+# keeps it counted from the position itself; checkmate scores carry no distance and are stored as they are
+def scoreToTable(score, ply):
+    if TABLEBASE_WIN - MAX_TABLEBASE_PLIES <= abs(score) < CHECKMATE:
+        return score + ply if score > 0 else score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if TABLEBASE_WIN - MAX_TABLEBASE_PLIES <= abs(score) < CHECKMATE:
+        return score - ply if score > 0 else score + ply
+    return score
+
+
+# material the side making move wins on its end square if both sides keep recapturing with their cheapest piece
+# pieces are lifted off the board as they capture, so sliders lined up behind them join in
+def staticExchangeEvaluation(gs, move):
+    board = gs.board
+    target = (move.endRow, move.endCol)
+    saved = [((move.startRow, move.startCol), board[move.startRow][move.startCol])]
+    board[move.startRow][move.startCol] = "--"
+    if move.isEnpassantMove:
+        saved.append(((move.startRow, move.endCol), board[move.startRow][move.endCol]))
+        board[move.startRow][move.endCol] = "--"
+    gains = [pieceScore[move.pieceCaptured[1]] if move.isCapture else 0]
+    pieceOnSquare = move.pieceMoved[0] + 'Q' if move.isPawnPromotion else move.pieceMoved
+    sideToCapture = 'b' if move.pieceMoved[0] == 'w' else 'w'
+    while True:
+        attackers = gs.attackersOf(target, sideToCapture)
+        if not attackers:
+            break
+        attacker = min(attackers, key=lambda square: exchangeValue(board[square[0]][square[1]]))
+        attackingPiece = board[attacker[0]][attacker[1]]
+        if attackingPiece[1] == 'K' and gs.attackersOf(target, pieceOnSquare[0]):
+            break # the king cannot capture into a defended square
+        gains.append(exchangeValue(pieceOnSquare) - gains[-1])
+        saved.append((attacker, attackingPiece))
+        board[attacker[0]][attacker[1]] = "--"
+        pieceOnSquare = attackingPiece
+        sideToCapture = 'b' if sideToCapture == 'w' else 'w'
+    for (r, c), piece in reversed(saved):
+        board[r][c] = piece
+    # either side can stop capturing when continuing would lose material
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+def exchangeValue(piece):
+    return 100 if piece[1] == 'K' else pieceScore[piece[1]]
+
+
+# True when the side to move has a piece besides king and pawns, without one a pass can be its best move
+def hasPieces(gs):
+    color = 'w' if gs.whiteToMove else 'b'
+    for row in gs.board:
+        for piece in row:
+            if piece[0] == color and piece[1] in 'NBRQ':
+                return True
+    return False
 
 
-# negaMax including alpha-beta pruning 
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove, counter
-    counter += 1
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-    random.shuffle(validMoves)
-    maxScore = -CHECKMATE
-    for move in validMoves:
-        gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth-1, -beta, -alpha, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-              
-        gs.undoMove()
-        if maxScore > alpha: # pruning happens
-            alpha = maxScore
-        if alpha >= beta:
-            break 
-          
-    return maxScore
-      
-
-      
 # a positive score is good for white, a negative score is good for black
+# the game state keeps material and piece-square totals up to date as moves are made, so this is O(1)
 def scoreBoard(gs):
     if gs.checkMate:
         if gs.whiteToMove:
@@ -207,26 +627,9 @@ def scoreBoard(gs):
             return CHECKMATE # white wins 
     elif gs.staleMate:
         return STALEMATE 
-  
-    score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-            if square != '--':
-                # score it positionally
-                piecePositionScore = 0
-                if square[1] != 'K':
-                    if square[1] == "p":
-                        piecePositionScore = piecePositionScores[square][row][col]
-                    else:
-                        piecePositionScore = piecePositionScores[square[1]][row][col]
-                      
-                if square[0] == 'w':
-                    score += pieceScore[square[1]] + (piecePositionScore * 0.1)
-                elif square[0] == 'b':
-                    score -= pieceScore[square[1]] + (piecePositionScore * 0.1)
-              
-    return score
+    elif gs.repetitionDraw or gs.fiftyMoveDraw:
+        return DRAW
+    return gs.materialScore + gs.positionScore * 0.1
 
   
 
@@ -239,4 +642,7 @@ def scoreMaterial(board):
                 score += pieceScore[square[1]]
             elif square[0] == 'b':
                 score -= pieceScore[square[1]]
-    return score
\ No newline at end of file
+    return score
+
+
+defaultSearcher = Searcher(transpositionTable) # used by findBestMove, shares the module transposition table - made last, as a Searcher needs scoreBoard
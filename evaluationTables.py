@@ -0,0 +1,62 @@
+"""
+Material values and piece-square tables used to score a position.
+The game state keeps running totals of these as moves are made, chessAI reads the totals to score the board.
+"""
+
+pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1}
+
+knightScore = [[1, 1, 1, 1, 1, 1, 1, 1],
+              [1, 2, 2, 2, 2, 2, 2, 1],
+              [1, 2, 3, 3, 3, 3, 2, 1],
+              [1, 2, 3, 4, 4, 3, 2, 1],
+              [1, 2, 3, 4, 4, 3, 2, 1],
+              [1, 2, 3, 3, 3, 3, 2, 1],
+              [1, 2, 2, 2, 2, 2, 2, 1],
+              [1, 1, 1, 1, 1, 1, 1, 1]] # finding best knight position
+
+bishopScores = [[4, 3, 2, 1, 1, 2, 3, 4],
+               [3, 4, 3, 2, 2, 3, 4, 3],
+               [2, 3, 4, 3, 3, 4, 3, 2],
+               [1, 2, 3, 4, 4, 3, 2, 1],
+               [1, 2, 3, 4, 4, 3, 2, 1],
+               [2, 3, 4, 3, 3, 4, 3, 2],
+               [3, 4, 3, 2, 2, 3, 4, 3],
+               [4, 3, 2, 1, 1, 2, 3, 4]]
+
+queenScores = [[1, 1, 1, 3, 1, 1, 1, 1],
+              [1, 2, 3, 3, 3, 1, 1, 1],
+              [1, 4, 3, 3, 3, 2, 2, 1],
+              [1, 2, 3, 3, 3, 2, 2, 1],
+              [1, 2, 3, 3, 3, 2, 2, 1],
+              [1, 4, 3, 3, 3, 2, 2, 1],
+              [1, 1, 1, 3, 1, 1, 1, 1],
+              [1, 1, 1, 3, 1, 1, 1, 1]]
+
+rookScores = [[4, 3, 4, 4, 4, 4, 3, 4],
+             [4, 4, 4, 4, 4, 4, 4, 4],
+             [1, 1, 2, 3, 3, 2, 1, 1],
+             [1, 2, 3, 4, 4, 3, 2, 1],
+             [1, 2, 3, 4, 4, 3, 2, 1],
+             [1, 1, 2, 2, 2, 2, 1, 1],
+             [4, 4, 4, 4, 4, 4, 4, 4],
+             [4, 3, 4, 4, 4, 4, 3, 4]]
+
+whitePawnScores = [[8, 8, 8, 8, 8, 8, 8, 8],
+                  [8, 8, 8, 8, 8, 8, 8, 8],
+                  [5, 6, 6, 7, 7, 6, 6, 5],
+                  [2, 3, 3, 4, 4, 3, 2 ,1],
+                  [1, 2, 3, 4, 4, 3, 2, 1],
+                  [1, 1, 2, 3, 3, 2, 1, 1],
+                  [1, 1, 1, 0, 0, 1, 1, 1],
+                  [0, 0, 0, 0, 0, 0, 0, 0]]
+
+blackPawnScores = [[0, 0, 0, 0, 0, 0, 0, 0],
+                  [1, 1, 1, 0, 0, 1, 1, 1],
+                  [1, 1, 2, 3, 3, 2, 1, 1],
+                  [1, 2, 3, 4, 4, 3, 2, 1],
+                  [2, 3, 3, 4, 4, 3, 2 ,1],
+                  [5, 6, 6, 7, 7, 6, 6, 5],
+                  [8, 8, 8, 8, 8, 8, 8, 8],
+                  [8, 8, 8, 8, 8, 8, 8, 8]]
+
+piecePositionScores = {"N": knightScore, "Q": queenScores, "B": bishopScores, "R": rookScores, "bp": blackPawnScores, "wp": whitePawnScores}
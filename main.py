@@ -2,8 +2,11 @@
 This is our main driver file. It will be responsible for handling user input and displaying the current GameState object
 """
 
+import copy
+import os
+import queue
 import pygame as p
-import ChessEngine, chessAI
+import ChessEngine, chessAI, openingBook, tablebase
 
 p.init()
 BOARD_WIDTH = BOARD_HEIGHT = 280
@@ -12,6 +15,7 @@ MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
 DIMENSION = 8  # chess board dimensions 8x8
 SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = 15  # for animations later on
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin') # Polyglot opening book, used when present
 IMAGES = {}
 '''
 Initialize a global dictionary of images. This will be called exactly once in the main
@@ -30,7 +34,7 @@ def main():
     screen.fill(backgroundColor) 
     p.display.flip()
     moveLogFont = p.font.SysFont("Arial", 10, False, False)
-    gs = ChessEngine.GameState()
+    gs = ChessEngine.newGameState()
     validMoves = gs.getValidMoves() # list of all valid moves
     moveMade = False # flag var for when a move is made - list will only be regenerated after the user makes a move
     
@@ -43,11 +47,25 @@ def main():
     gameOver = False
     playerOne = True # if a human if playing white, this will be true, if an AI is playing then false
     playerTwo = False # same as above but for black 
+    ponder = True # if true the AI searches the reply it expects while the human is thinking
+    searcher = chessAI.Searcher(chessAI.transpositionTable)
+    if os.path.exists(BOOK_FILE):
+        searcher.book = openingBook.OpeningBook(BOOK_FILE)
+    if os.path.isdir(tablebase.TABLEBASE_DIR): # generated with python tablebase.py generate KQK KRK ...
+        searcher.tablebases = tablebase.Tablebases()
+    aiThinking = False # flag var for when the AI is searching on its thread
+    pondering = False # flag var for when the AI is searching the position after the human's expected reply
+    ponderMove = None
+    moveFinderThread = None
+    returnQueue = None
     while running:
         humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+                if aiThinking or pondering:
+                    cancelSearch(searcher, moveFinderThread)
+                    aiThinking = pondering = False
             # mouse handler
             elif e.type == p.MOUSEBUTTONDOWN: 
                 if (gameOver == False) and (humanTurn == True):
@@ -77,12 +95,18 @@ def main():
             # key handlers
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z: # undo when 'z' is pressed
+                    if aiThinking or pondering: # the search was for the position being undone
+                        cancelSearch(searcher, moveFinderThread)
+                        aiThinking = pondering = False
                     gs.undoMove() 
                     moveMade = True
                     animate = False
                     gameOver = False
                 if e.key == p.K_r: # resets the game when r is pressed
-                    gs = ChessEngine.GameState()
+                    if aiThinking or pondering:
+                        cancelSearch(searcher, moveFinderThread)
+                        aiThinking = pondering = False
+                    gs = ChessEngine.newGameState()
                     validMoves = gs.getValidMoves()
                     sqSelected =()
                     playerClicks =[]
@@ -90,14 +114,41 @@ def main():
                     animate = False
                     gameOver = False 
 
-        # AI move finder
-        if not gameOver and not humanTurn:
-            AIMove = chessAI.findBestMove(gs, validMoves)
-            if AIMove is None: # no best move found
-                AIMove = chessAI.findRandomMove(validMoves)
-            gs.makeMove(AIMove)
-            moveMade = True
-            animate = True 
+        # AI move finder - searches a copy of the game state on another thread so the window keeps drawing
+        if not gameOver and not humanTurn and running:
+            if pondering: # the human has replied while the AI was searching the reply it expected
+                pondering = False
+                if gs.moveLog[-1] == ponderMove: # ponder hit, the search already running is for this position
+                    searcher.ponderhit(depth=chessAI.DEPTH)
+                    aiThinking = True
+                else: # ponder miss, throw that search away
+                    cancelSearch(searcher, moveFinderThread)
+            if not aiThinking:
+                aiThinking = True
+                returnQueue = queue.Queue() # a new queue per search, so a cancelled search can never deliver a move
+                searchState = copy.deepcopy(gs) # the board being drawn never changes under the search
+                moveFinderThread = searcher.searchInBackground(searchState, searchState.getValidMoves(), returnQueue.put)
+            elif not returnQueue.empty():
+                result = returnQueue.get()
+                AIMove = result.bestMove
+                aiThinking = False
+                if AIMove is None: # no best move found
+                    AIMove = chessAI.findRandomMove(validMoves)
+                else: # the move was made on the copy, use the matching move of this game state
+                    AIMove = validMoves[validMoves.index(AIMove)]
+                gs.makeMove(AIMove)
+                moveMade = True
+                animate = True 
+                if ponder and len(result.pv) > 1 and result.pv[0] == AIMove:
+                    # the principal variation's next move is the reply the AI expects, search the position after it
+                    ponderState = copy.deepcopy(gs)
+                    replies = ponderState.getValidMoves()
+                    if result.pv[1] in replies:
+                        ponderMove = replies[replies.index(result.pv[1])]
+                        ponderState.makeMove(ponderMove)
+                        returnQueue = queue.Queue()
+                        moveFinderThread = searcher.searchInBackground(ponderState, ponderState.getValidMoves(), returnQueue.put, infinite=True)
+                        pondering = True
       
         if moveMade:
               if animate == True:
@@ -108,10 +159,17 @@ def main():
           
         drawGameState(screen, gs, validMoves, sqSelected, moveLogFont)
 
-        if gs.checkMate or gs.checkMate:
+        if gs.checkMate or gs.staleMate or gs.repetitionDraw or gs.fiftyMoveDraw:
             gameOver = True
+            if aiThinking or pondering: # the human's move ended the game, the ponder search would run on until undo or reset
+                cancelSearch(searcher, moveFinderThread)
+                aiThinking = pondering = False
             if gs.staleMate:
                 text = 'Stalemate'
+            elif gs.repetitionDraw:
+                text = 'Draw by threefold repetition'
+            elif gs.fiftyMoveDraw:
+                text = 'Draw by the fifty-move rule'
             else: 
                 text = 'Black wins by checkmate' if gs.whiteToMove else 'White wins by checkmate'
         
@@ -119,6 +177,11 @@ def main():
         clock.tick(MAX_FPS)
         p.display.flip()
 
+# stops the search and waits for its thread, which returns within a node
+def cancelSearch(searcher, moveFinderThread):
+    searcher.stop()
+    moveFinderThread.join()
+
 """
 Responsible for all the graphics within current game state
 """
@@ -0,0 +1,389 @@
+"""
+Match runner - plays two engine configurations against each other on a process pool to tell whether a change made
+the engine stronger. Every opening is played twice with colours swapped, so neither side profits from a lopsided
+opening. Games end on mate, stalemate, threefold repetition, the fifty-move rule, bare material or the move limit.
+Reports the result as Elo with a 95% error bar and can stop early with a sequential probability ratio test (SPRT)
+between elo0 and elo1.
+
+    python match.py --engine1 "depth=3" --engine2 "depth=3 pruning=False" --games 2000 --sprt
+    python match.py --engine1 "movetime=0.2 NULL_MOVE_REDUCTION=2" --engine2 "movetime=0.2" --workers 4
+    python match.py --engine1 "depth=4" --engine2 "cmd='python ../baseline/uci.py' depth=4" --openings book.epd
+
+A configuration is a list of key=value settings. depth, movetime (seconds) and nodes limit every move, the default
+is depth chessAI.DEPTH. backend and hash pick the GameState class and table size. A lower-case key that is an
+attribute of chessAI.Searcher sets it, an upper-case one from tunableConstants overrides that chessAI constant while
+the engine searches, and name labels the engine. With cmd the engine is any UCI engine run as a subprocess - an older checkout
+of this one, say - and its other keys go to it as setoption.
+"""
+
+import argparse
+import ast
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import time
+import ChessEngine, chessAI, uci
+from batchAnalysis import parsePositionLine, readPositions
+from transpositionTable import TranspositionTable
+
+MAX_MOVES = 200 # full moves before a game is adjudicated a draw
+REPORT_EVERY = 20 # games between progress lines
+SPRT_MIN_GAMES = 32 # the variance of a handful of games is too rough to stop on
+# chessAI constants a configuration may override - the rest size tables at import or define the score scale
+tunableConstants = ('DEPTH', 'DELTA_MARGIN', 'NULL_WINDOW', 'NULL_MOVE_MIN_DEPTH', 'NULL_MOVE_REDUCTION', 'LMR_MIN_DEPTH',
+                    'LMR_FULL_MOVES', 'ASPIRATION_MIN_DEPTH', 'ASPIRATION_WINDOW')
+
+# balanced positions a few moves into common openings
+openingPositions = [
+    ('italian', 'r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/2P2N2/PP1P1PPP/RNBQK2R w KQkq - 1 5'),
+    ('ruylopez', 'r1bqk2r/1pppbppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 4 6'),
+    ('scotch', 'r1bqkb1r/pppp1ppp/2n2n2/8/3NP3/8/PPP2PPP/RNBQKB1R w KQkq - 1 5'),
+    ('sicilian', 'rnbqkb1r/1p2pppp/p2p1n2/8/3NP3/2N5/PPP2PPP/R1BQKB1R w KQkq - 0 6'),
+    ('french', 'rnbqk2r/ppp1bppp/4pn2/3p2B1/3PP3/2N5/PPP2PPP/R2QKBNR w KQkq - 4 5'),
+    ('carokann', 'rn1qkbnr/pp2pppp/2p5/5b2/3PN3/8/PPP2PPP/R1BQKBNR w KQkq - 1 5'),
+    ('pirc', 'rnbqk2r/ppp1ppbp/3p1np1/8/3PPP2/2N5/PPP3PP/R1BQKBNR w KQkq - 1 5'),
+    ('scandinavian', 'rnb1kb1r/ppp1pppp/5n2/q7/3P4/2N5/PPP2PPP/R1BQKBNR w KQkq - 1 5'),
+    ('queensgambit', 'rnbqk2r/ppp1bppp/4pn2/3p2B1/2PP4/2N5/PP2PPPP/R2QKBNR w KQkq - 4 5'),
+    ('slav', 'rnbqkb1r/pp2pppp/2p2n2/8/2pP4/2N2N2/PP2PPPP/R1BQKB1R w KQkq - 0 5'),
+    ('kingsindian', 'rnbq1rk1/ppp1ppbp/3p1np1/8/2PPP3/2N2N2/PP3PPP/R1BQKB1R w KQ - 2 6'),
+    ('nimzoindian', 'rnbq1rk1/pppp1ppp/4pn2/8/1bPP4/2N1P3/PP3PPP/R1BQKBNR w KQ - 1 5'),
+    ('london', 'rnbqkb1r/pp3ppp/4pn2/2pp4/3P1B2/4PN2/PPP2PPP/RN1QKB1R w KQkq - 0 5'),
+    ('english', 'rnbqkb1r/ppp2ppp/8/3np3/8/2N3P1/PP1PPP1P/R1BQKBNR w KQkq - 0 5'),
+    ('reti', 'rnbqk2r/ppp1bppp/4pn2/3p4/8/5NP1/PPPPPPBP/RNBQ1RK1 w kq - 2 5'),
+    ('dutch', 'rnbqk2r/ppppp1bp/5np1/5p2/3P4/5NP1/PPP1PPBP/RNBQK2R w KQkq - 2 5'),
+]
+
+
+# {key: value} from a configuration string such as "depth=3 pruning=False name=base"
+def parseConfig(text):
+    config = {}
+    for token in shlex.split(text):
+        key, separator, value = token.partition('=')
+        if not separator or not key:
+            raise ValueError('settings are key=value, got ' + token)
+        config[key] = value
+    return config
+
+
+# a setting's value as a Python literal where it reads as one, otherwise as the string
+def literal(value):
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+# plays with a chessAI.Searcher in this process, on its own GameState kept in step with the game
+class SearcherEngine():
+    def __init__(self, config):
+        self.backend = config.get('backend', 'mailbox')
+        if self.backend not in ChessEngine.backends:
+            raise ValueError('unknown backend ' + self.backend)
+        self.depth = int(config['depth']) if 'depth' in config else None
+        self.movetime = float(config['movetime']) if 'movetime' in config else None
+        self.nodes = int(config['nodes']) if 'nodes' in config else None
+        self.table = TranspositionTable(int(config.get('hash', chessAI.HASH_SIZE_MB)))
+        self.attributes = {}
+        self.constants = {}
+        searcherAttributes = vars(chessAI.Searcher(self.table))
+        for key, value in config.items():
+            if key in ('backend', 'depth', 'movetime', 'nodes', 'hash', 'name'):
+                continue
+            if key in searcherAttributes:
+                self.attributes[key] = literal(value)
+            elif key in tunableConstants:
+                self.constants[key] = literal(value)
+            else:
+                raise ValueError('unknown setting ' + key)
+        self.gs = None
+
+    # a fresh table and fresh move ordering tables for every game, so games do not depend on what ran before
+    def newGame(self, fen):
+        self.gs = ChessEngine.newGameState(self.backend, fen)
+        self.table.clear()
+        self.searcher = chessAI.Searcher(self.table)
+        for key, value in self.attributes.items():
+            setattr(self.searcher, key, value)
+
+    def play(self, text):
+        self.gs.makeMove(uci.parseMove(self.gs, text))
+
+    # the UCI move the engine picks, or None when it has none
+    def bestMove(self):
+        saved = {key: getattr(chessAI, key) for key in self.constants}
+        for key, value in self.constants.items():
+            setattr(chessAI, key, value)
+        try:
+            result = self.searcher.search(self.gs, self.gs.getValidMoves(), self.depth, self.movetime, self.nodes)
+        finally:
+            for key, value in saved.items():
+                setattr(chessAI, key, value)
+        return None if result.bestMove is None else uci.uciMove(result.bestMove)
+
+    def close(self):
+        pass
+
+
+# plays with any UCI engine run as a subprocess
+class UCIProcessEngine():
+    def __init__(self, config):
+        self.process = subprocess.Popen(shlex.split(config['cmd']), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        text=True, bufsize=1)
+        limits = []
+        if 'depth' in config:
+            limits.append('depth %d' % int(config['depth']))
+        if 'movetime' in config:
+            limits.append('movetime %d' % round(float(config['movetime']) * 1000))
+        if 'nodes' in config:
+            limits.append('nodes %d' % int(config['nodes']))
+        self.goCommand = 'go ' + (' '.join(limits) if limits else 'depth %d' % chessAI.DEPTH)
+        self.send('uci')
+        self.waitFor('uciok')
+        for key, value in config.items():
+            if key not in ('cmd', 'depth', 'movetime', 'nodes', 'name'):
+                self.send('setoption name %s value %s' % (key, value))
+        self.fen = None
+        self.moves = []
+
+    def send(self, line):
+        self.process.stdin.write(line + '\n')
+        self.process.stdin.flush()
+
+    # reads output up to the first line starting with prefix and returns that line
+    def waitFor(self, prefix):
+        for line in self.process.stdout:
+            if line.startswith(prefix):
+                return line
+        raise RuntimeError('the engine exited before sending ' + prefix)
+
+    def newGame(self, fen):
+        self.send('ucinewgame')
+        self.send('isready')
+        self.waitFor('readyok')
+        self.fen = fen
+        self.moves = []
+
+    def play(self, text):
+        self.moves.append(text)
+
+    def bestMove(self):
+        self.send('position fen ' + self.fen + (' moves ' + ' '.join(self.moves) if self.moves else ''))
+        self.send(self.goCommand)
+        move = self.waitFor('bestmove').split()[1]
+        return None if move in ('(none)', '0000') else move
+
+    def close(self):
+        try:
+            self.send('quit')
+            self.process.wait(5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+def makeEngine(config):
+    return UCIProcessEngine(config) if 'cmd' in config else SearcherEngine(config)
+
+
+# True when neither side has a pawn, rook or queen and at most one minor piece is left, so no mate can happen
+def insufficientMaterial(board):
+    minors = 0
+    for row in board:
+        for piece in row:
+            if piece[1] in 'pRQ':
+                return False
+            if piece[1] in 'NB':
+                minors += 1
+    return minors <= 1
+
+
+workerEngines = None # the two engines of this worker process, set up by initWorker
+
+
+def initWorker(configs):
+    global workerEngines
+    workerEngines = [makeEngine(config) for config in configs]
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl-C is the parent's to handle, it closes the pool
+
+
+# plays one game and returns its record, the result is from white's side
+def playGame(task):
+    gameNumber, openingName, fen, firstIsWhite, maxMoves = task
+    engines = workerEngines if firstIsWhite else workerEngines[::-1] # white first
+    gs = ChessEngine.GameState.fromFEN(fen)
+    for engine in engines:
+        engine.newGame(fen)
+    moves = []
+    result = reason = None
+    while result is None:
+        validMoves = gs.getValidMoves()
+        if gs.checkMate:
+            result, reason = ('0-1' if gs.whiteToMove else '1-0'), 'checkmate'
+        elif gs.staleMate:
+            result, reason = '1/2-1/2', 'stalemate'
+        elif gs.repetitionDraw:
+            result, reason = '1/2-1/2', 'threefold repetition'
+        elif gs.fiftyMoveDraw:
+            result, reason = '1/2-1/2', 'fifty-move rule'
+        elif insufficientMaterial(gs.board):
+            result, reason = '1/2-1/2', 'insufficient material'
+        elif len(moves) >= 2 * maxMoves:
+            result, reason = '1/2-1/2', 'move limit'
+        else:
+            text = engines[0 if gs.whiteToMove else 1].bestMove()
+            move = None if text is None else uci.parseMove(gs, text)
+            if move is None or move not in validMoves: # an engine that cannot move loses
+                result, reason = ('0-1' if gs.whiteToMove else '1-0'), 'illegal move %s' % text
+                break
+            text = uci.uciMove(move)
+            gs.makeMove(move)
+            moves.append(text)
+            for engine in engines:
+                engine.play(text)
+    return {'game': gameNumber, 'opening': openingName, 'fen': fen, 'engine1White': firstIsWhite,
+            'result': result, 'reason': reason, 'plies': len(moves), 'moves': moves}
+
+
+# expected score against an opponent elo points weaker
+def expectedScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+# elo difference for an average score, infinite at 0 and 1
+def scoreElo(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+# (elo, low, high) of the 95% confidence interval, from engine1's wins, draws and losses
+def eloInterval(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    deviation = math.sqrt(max((wins + draws / 4) / games - score * score, 0) / games)
+    return scoreElo(score), scoreElo(score - 1.96 * deviation), scoreElo(score + 1.96 * deviation)
+
+
+# log-likelihood ratio of elo1 against elo0 for the results so far, the generalized SPRT approximation
+# (the score per game treated as normally distributed with the observed variance)
+def sprtLLR(wins, draws, losses, elo0, elo1):
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins + draws / 4) / games - score * score
+    if variance <= 0:
+        return 0.0
+    s0, s1 = expectedScore(elo0), expectedScore(elo1)
+    return games * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+
+
+# (lower, upper) LLR bounds - below accepts elo0 with error rate beta, above accepts elo1 with error rate alpha
+def sprtBounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def formatElo(wins, draws, losses):
+    elo, low, high = eloInterval(wins, draws, losses)
+    if math.isinf(elo) or math.isinf(low) or math.isinf(high):
+        return 'Elo %+.1f' % elo
+    return 'Elo %+.1f +/- %.1f' % (elo, (high - low) / 2)
+
+
+# (gameNumber, opening name, fen, engine1 plays white, max moves) for every game, each opening twice in a row
+def gameTasks(openings, games, maxMoves):
+    pairs = itertools.cycle(openings)
+    for gameNumber in range(1, games + 1):
+        if gameNumber % 2:
+            name, fen = next(pairs)
+        yield gameNumber, name, fen, gameNumber % 2 == 1, maxMoves
+
+
+# (name, FEN) of every position in an EPD or FEN file, the EPD id naming it when there is one
+def loadOpenings(path):
+    openings = []
+    with open(path) as f:
+        for lineNumber, text in readPositions(f):
+            fen, operations = parsePositionLine(text)
+            openings.append((operations.get('id', 'line %d' % lineNumber), fen))
+    return openings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play two engine configurations against each other')
+    parser.add_argument('--engine1', default='', help='settings of the engine under test')
+    parser.add_argument('--engine2', default='', help='settings of the engine it is measured against')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--openings', help='EPD or FEN file of start positions (default: a built-in set)')
+    parser.add_argument('--max-moves', dest='maxMoves', type=int, default=MAX_MOVES, help='full moves before a draw')
+    parser.add_argument('--sprt', action='store_true', help='stop once the SPRT accepts elo0 or elo1')
+    parser.add_argument('--elo0', type=float, default=0.0)
+    parser.add_argument('--elo1', type=float, default=10.0)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--output', help='JSONL file with one record per game')
+    args = parser.parse_args(argv)
+
+    try:
+        configs = [parseConfig(args.engine1), parseConfig(args.engine2)]
+        for config in configs:
+            if 'cmd' not in config:
+                SearcherEngine(config) # a bad setting fails here rather than in every worker
+    except ValueError as error:
+        parser.error(str(error))
+    names = [configs[0].get('name', 'engine1'), configs[1].get('name', 'engine2')]
+    openings = loadOpenings(args.openings) if args.openings else openingPositions
+    lower, upper = sprtBounds(args.alpha, args.beta)
+    output = open(args.output, 'w') if args.output else None
+    wins = draws = losses = 0
+    decision = None
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(args.workers, initWorker, (configs,)) as pool:
+            for record in pool.imap_unordered(playGame, gameTasks(openings, args.games, args.maxMoves)):
+                if record['result'] == '1/2-1/2':
+                    draws += 1
+                elif (record['result'] == '1-0') == record['engine1White']:
+                    wins += 1
+                else:
+                    losses += 1
+                if output is not None:
+                    record['white'], record['black'] = names if record['engine1White'] else names[::-1]
+                    output.write(json.dumps(record) + '\n')
+                    output.flush()
+                games = wins + draws + losses
+                llr = sprtLLR(wins, draws, losses, args.elo0, args.elo1)
+                if args.sprt and games >= SPRT_MIN_GAMES and (llr <= lower or llr >= upper):
+                    decision = 'H1 accepted, %s is stronger by %g Elo or more' % (names[0], args.elo1) if llr >= upper \
+                        else 'H0 accepted, %s is not stronger by %g Elo' % (names[0], args.elo1)
+                if games % REPORT_EVERY == 0 or decision is not None:
+                    print('%5d games  %s  +%d =%d -%d  %s' % (games, names[0], wins, draws, losses, formatElo(wins, draws, losses))
+                          + ('  LLR %.2f [%.2f, %.2f]' % (llr, lower, upper) if args.sprt else ''), flush=True)
+                if decision is not None:
+                    break # leaving the with block terminates the games still running
+    except KeyboardInterrupt:
+        print('interrupted', file=sys.stderr)
+    finally:
+        if output is not None:
+            output.close()
+    games = wins + draws + losses
+    elapsed = time.perf_counter() - start
+    if games:
+        print('%s vs %s: %d games, +%d =%d -%d, %s, %.0f games/hour'
+              % (names[0], names[1], games, wins, draws, losses, formatElo(wins, draws, losses), games / elapsed * 3600))
+    if args.sprt:
+        print(decision or 'SPRT inconclusive, LLR %.2f [%.2f, %.2f]' % (sprtLLR(wins, draws, losses, args.elo0, args.elo1),
+                                                                      lower, upper))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Memory microbenchmark for Move objects in the search hot path.
+Reports how many Moves a depth 4 search builds per node, the heap blocks and bytes each one costs,
+and the peak traced memory of the whole search.
+
+    python moveBenchmark.py [--depth 4] [--backend mailbox]
+"""
+
+import argparse
+import sys
+import tracemalloc
+import ChessEngine, chessAI
+
+benchmarkPositions = [
+    ('start', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'),
+]
+
+
+# heap blocks and bytes held by one Move, measured over a batch so allocator noise averages out
+def moveFootprint(count=10000):
+    gs = ChessEngine.GameState()
+    tracemalloc.start()
+    blocksBefore = sys.getallocatedblocks()
+    moves = [ChessEngine.Move((6, 4), (4, 4), gs.board) for _ in range(count)]
+    blocks = sys.getallocatedblocks() - blocksBefore
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del moves
+    return blocks / count, size / count
+
+
+# runs a fresh search on fen and returns (nodes, moves constructed, peak traced bytes)
+def searchProfile(backend, fen, depth):
+    constructed = [0]
+    moveInit = ChessEngine.Move.__init__
+    def countingInit(self, *args, **kwargs):
+        constructed[0] += 1
+        moveInit(self, *args, **kwargs)
+    searcher = chessAI.Searcher()
+    gs = ChessEngine.newGameState(backend, fen)
+    ChessEngine.Move.__init__ = countingInit
+    try:
+        tracemalloc.start()
+        result = searcher.search(gs, gs.getValidMoves(), depth=depth)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        ChessEngine.Move.__init__ = moveInit
+    return result.nodes, constructed[0], peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move allocation and peak memory benchmark')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--backend', default='mailbox', choices=ChessEngine.backends)
+    args = parser.parse_args(argv)
+    blocksPerMove, bytesPerMove = moveFootprint()
+    print('per Move: %.1f heap blocks, %.0f bytes' % (blocksPerMove, bytesPerMove))
+    for name, fen in benchmarkPositions:
+        nodes, constructed, peak = searchProfile(args.backend, fen, args.depth)
+        movesPerNode = constructed / nodes if nodes else 0.0
+        print('%-8s depth %d: %d nodes, %.1f Moves/node, %.1f blocks/node from Moves, peak %.2f MB'
+              % (name, args.depth, nodes, movesPerNode, movesPerNode * blocksPerMove, peak / (1024 * 1024)))
+
+
+if __name__ == '__main__':
+    main()
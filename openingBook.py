@@ -0,0 +1,142 @@
+"""
+Polyglot opening books - the .bin format most engines and GUIs share.
+A book is a file of 16 byte entries sorted by position key: key (8 bytes), move (2), weight (2) and learn (4), all
+big-endian. The file is memory mapped and binary searched, so a probe reads a handful of pages however big the book is
+and opening a multi-GB book costs nothing up front.
+
+    python openingBook.py book.bin ["<fen>"]    lists the book moves for a position (default: the start position)
+"""
+
+import mmap
+import os
+import random
+import struct
+import sys
+import ChessEngine
+from polyglotRandom import polyglotRandom
+
+ENTRY_SIZE = 16
+entryStruct = struct.Struct('>QHHI')
+keyStruct = struct.Struct('>Q')
+
+# Polyglot numbers its piece kinds black pawn, white pawn, black knight, white knight ... white king
+# and its squares a1 = 0 up to h8 = 63, so these tables are laid out by the engine's square index r * 8 + c instead
+pieceKeys = {'--': [0] * 64}
+for _kind, _piece in enumerate(['bp', 'wp', 'bN', 'wN', 'bB', 'wB', 'bR', 'wR', 'bQ', 'wQ', 'bK', 'wK']):
+    pieceKeys[_piece] = [polyglotRandom[64 * _kind + 8 * (7 - sq // 8) + sq % 8] for sq in range(64)]
+CASTLE_OFFSET = 768 # white kingside, white queenside, black kingside, black queenside
+ENPASSANT_OFFSET = 772 # plus the file
+TURN_KEY = polyglotRandom[780] # only in the key when white is to move
+
+
+# the Polyglot key of a position - unlike GameState.zobristKey, the en passant file only counts when a pawn of the
+# side to move stands next to the pawn that just moved two squares
+def polyglotKey(gs):
+    key = 0
+    sq = 0
+    for row in gs.board:
+        for piece in row:
+            if piece != '--':
+                key ^= pieceKeys[piece][sq]
+            sq += 1
+    rights = gs.currentCastlingRights
+    if rights.wks:
+        key ^= polyglotRandom[CASTLE_OFFSET]
+    if rights.wqs:
+        key ^= polyglotRandom[CASTLE_OFFSET + 1]
+    if rights.bks:
+        key ^= polyglotRandom[CASTLE_OFFSET + 2]
+    if rights.bqs:
+        key ^= polyglotRandom[CASTLE_OFFSET + 3]
+    if gs.enpassantPossible != ():
+        row, col = gs.enpassantPossible
+        pawnRow, capturer = (row + 1, 'wp') if gs.whiteToMove else (row - 1, 'bp')
+        if (col > 0 and gs.board[pawnRow][col - 1] == capturer) or (col < 7 and gs.board[pawnRow][col + 1] == capturer):
+            key ^= polyglotRandom[ENPASSANT_OFFSET + col]
+    if gs.whiteToMove:
+        key ^= TURN_KEY
+    return key
+
+
+# (startRow, startCol, endRow, endCol) of a Polyglot move, or None for an under-promotion the engine can not play
+# castling is stored as the king taking its own rook, the engine moves the king two squares instead
+def decodeMove(bookMove, board):
+    endCol, endRank = bookMove & 7, (bookMove >> 3) & 7
+    startCol, startRank = (bookMove >> 6) & 7, (bookMove >> 9) & 7
+    promotion = (bookMove >> 12) & 7
+    if promotion not in (0, 4): # 4 is a queen
+        return None
+    startRow, endRow = 7 - startRank, 7 - endRank
+    if board[startRow][startCol][1] == 'K' and startCol == 4 and board[endRow][endCol] == board[startRow][startCol][0] + 'R':
+        endCol = 6 if endCol == 7 else 2
+    return startRow, startCol, endRow, endCol
+
+
+class OpeningBook():
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.entryCount = size // ENTRY_SIZE
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b'' # an empty file can not be mapped
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # index of the first entry with this key or a larger one
+    def lowerBound(self, key):
+        low, high = 0, self.entryCount
+        while low < high:
+            middle = (low + high) // 2
+            if keyStruct.unpack_from(self.map, middle * ENTRY_SIZE)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # (move, weight) for every book move of the position that is legal here, best weight first
+    def probe(self, gs, validMoves=None):
+        key = polyglotKey(gs)
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        movesBySquares = {(move.startRow, move.startCol, move.endRow, move.endCol): move for move in validMoves}
+        found = []
+        index = self.lowerBound(key)
+        while index < self.entryCount:
+            entryKey, bookMove, weight, learn = entryStruct.unpack_from(self.map, index * ENTRY_SIZE)
+            if entryKey != key:
+                break
+            move = movesBySquares.get(decodeMove(bookMove, gs.board))
+            if move is not None: # a colliding key or a corrupt entry can name a move that is not legal here
+                found.append((move, weight))
+            index += 1
+        found.sort(key=lambda entry: entry[1], reverse=True)
+        return found
+
+    # a book move for the position or None - 'weighted' picks at random in proportion to the weights,
+    # 'best' always takes the highest weight; moves with weight 0 are never picked
+    def chooseMove(self, gs, validMoves=None, mode='weighted', rng=random):
+        entries = [(move, weight) for move, weight in self.probe(gs, validMoves) if weight > 0]
+        if not entries:
+            return None
+        if mode == 'best':
+            return entries[0][0]
+        return rng.choices([move for move, weight in entries], [weight for move, weight in entries])[0]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('usage: python openingBook.py book.bin ["<fen>"]')
+    gs = ChessEngine.GameState.fromFEN(sys.argv[2]) if len(sys.argv) > 2 else ChessEngine.GameState()
+    with OpeningBook(sys.argv[1]) as book:
+        print('key %016x, %d entries in the book' % (polyglotKey(gs), book.entryCount))
+        for move, weight in book.probe(gs):
+            print('%s %d' % (move.getChessNotation(), weight))
@@ -0,0 +1,239 @@
+"""
+Root-parallel search on a multiprocessing pool.
+Every root move is its own task - a worker rebuilds the position from GameState.toBytes, plays the move and searches
+the reply with its own chessAI.Searcher, so workers share nothing and nodes per second grow with the number of cores.
+Each worker process keeps its Searcher, transposition table included, from one task to the next.
+Without a shared window the root moves are searched with less pruning than one sequential search, so the total
+node count is higher - the previous best move goes to the pool first and its score becomes the bound for every move
+started after it, while the workers it would leave idle meanwhile search other moves against the previous iteration's
+score.
+
+    python parallelSearch.py [--depth 4] [--workers 1 2 4 8]    reports nodes/s and scaling efficiency
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+import ChessEngine, chessAI
+from transpositionTable import TranspositionTable
+
+workerSearcher = None # the Searcher of this worker process, set up by initWorker
+workerStopEvent = None
+
+
+def initWorker(hashSizeMB, stopEvent):
+    global workerSearcher, workerStopEvent
+    workerSearcher = chessAI.Searcher(TranspositionTable(hashSizeMB))
+    workerStopEvent = stopEvent
+
+
+# searches one root move to depth, returning (moveID, score, nodes, quiescence nodes, reply pv as moveIDs) with the
+# score from the root mover's side; only scores above alpha are exact, and the score is None when the time or node
+# limit stopped the search first
+# history is GameState.drawHistory of the root, so repetitions of positions before the root are still seen
+def searchRootMove(task):
+    backend, state, history, moveID, depth, alpha, deadline, nodes = task
+    if workerStopEvent.is_set() or (deadline is not None and time.time() >= deadline):
+        return moveID, None, 0, 0, [] # another move already won, or no time was left to start
+    gs = ChessEngine.gameStateClass(backend).fromBytes(state)
+    gs.setDrawHistory(*history)
+    for move in gs.getValidMoves():
+        if move.moveID == moveID:
+            gs.makeMove(move)
+            break
+    replies = gs.getValidMoves()
+    if gs.checkMate:
+        return moveID, chessAI.CHECKMATE, 1, 0, []
+    if gs.staleMate:
+        return moveID, chessAI.STALEMATE, 1, 0, []
+    if gs.repetitionCount() or gs.fiftyMoveDraw:
+        return moveID, chessAI.DRAW, 1, 0, []
+    movetime = None if deadline is None else max(0.0, deadline - time.time())
+    result = workerSearcher.search(gs, replies, depth - 1, movetime, nodes, -chessAI.CHECKMATE, -alpha)
+    if result.depth < depth - 1 and abs(result.score) < chessAI.CHECKMATE:
+        return moveID, None, result.nodes, result.quiescenceNodes, []
+    return moveID, -result.score, result.nodes, result.quiescenceNodes, [move.moveID for move in result.pv]
+
+
+# the root move followed by the reply line a worker found, as Moves of gs - which is left as it was
+def principalVariation(gs, rootMove, replyIDs):
+    pv = [rootMove]
+    gs.makeMove(rootMove)
+    for moveID in replyIDs:
+        move = next((move for move in gs.getValidMoves() if move.moveID == moveID), None)
+        if move is None:
+            break
+        gs.makeMove(move)
+        pv.append(move)
+    for _ in pv:
+        gs.undoMove()
+    return pv
+
+
+class ParallelSearcher():
+    def __init__(self, workers=None, hashSizeMB=chessAI.HASH_SIZE_MB):
+        self.workers = workers or os.cpu_count() or 1
+        self.stopEvent = multiprocessing.Event()
+        self.pool = multiprocessing.Pool(self.workers, initWorker, (hashSizeMB, self.stopEvent))
+        self.localSearcher = chessAI.Searcher(TranspositionTable(1)) # for searches too small to split
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # root moves that have not started yet are skipped, the ones already running finish their task
+    def stop(self):
+        self.stopEvent.set()
+
+    def findBestMove(self, gs, validMoves, depth=None, movetime=None, nodes=None):
+        return self.search(gs, validMoves, depth, movetime, nodes).bestMove
+
+    # searches moves to depth on the pool, starting a new one whenever a worker finishes so none waits for another;
+    # returns {moveID: (score, alpha it was searched with, reply pv)} and adds to nodeCounts [nodes, quiescence nodes]
+    # first, when given, is searched with the full window; the others are asked whether they beat alpha until first's
+    # score is in, the ones started after that whether they beat first
+    def searchMoves(self, rootTask, depth, first, moves, alpha, firstNodes, nodesPerMove, nodeCounts):
+        backend, state, history, deadline = rootTask
+        finished = queue.Queue()
+        results = {}
+        alphas = {}
+        waiting = list(moves)
+        running = 0
+        def start(move, moveAlpha, moveNodes):
+            alphas[move.moveID] = moveAlpha
+            self.pool.apply_async(searchRootMove, ((backend, state, history, move.moveID, depth, moveAlpha, deadline, moveNodes),),
+                                  callback=finished.put, error_callback=finished.put)
+        if first is not None:
+            start(first, -chessAI.CHECKMATE, firstNodes)
+            running += 1
+        while waiting and running < self.workers:
+            start(waiting.pop(0), alpha, nodesPerMove)
+            running += 1
+        while running:
+            item = finished.get()
+            if isinstance(item, BaseException):
+                raise item
+            moveID, score, taskNodes, taskQuiescenceNodes, replyPV = item
+            running -= 1
+            nodeCounts[0] += taskNodes
+            nodeCounts[1] += taskQuiescenceNodes
+            results[moveID] = (score, alphas[moveID], replyPV)
+            if score is not None and score >= chessAI.CHECKMATE:
+                self.stopEvent.set() # nothing beats a mate, let the remaining tasks return at once
+            if first is not None and moveID == first.moveID and score is not None:
+                alpha = score
+            if waiting:
+                start(waiting.pop(0), alpha, nodesPerMove)
+                running += 1
+        return results
+
+    # same limits and chessAI.SearchResult as chessAI.Searcher.search, iterative deepening at the root from depth 2
+    # each iteration searches the previous best move with the full window and the other root moves alongside it with
+    # windows that only ask whether they do better - see searchMoves; if the best move falls below the previous best
+    # score, the moves that only showed they did not beat that are searched again against its new score
+    # the first move found to mate wins and ends the search
+    def search(self, gs, validMoves, depth=None, movetime=None, nodes=None):
+        if depth is None and movetime is None and nodes is None:
+            depth = chessAI.DEPTH
+        if depth == 1 or len(validMoves) <= 1: # nothing worth splitting
+            return self.localSearcher.search(gs, validMoves, depth, movetime, nodes)
+        startTime = time.time()
+        self.stopEvent.clear()
+        deadline = None if movetime is None else startTime + movetime
+        rootTask = (gs.backend, gs.toBytes(), gs.drawHistory(), deadline)
+        rootMoves = sorted(validMoves, key=lambda move: chessAI.captureOrder(move) if move.isCapture else -100, reverse=True)
+        bestMove = rootMoves[0]
+        bestScore = 0
+        bestPV = [bestMove]
+        completedDepth = 1
+        nodeCounts = [0, 0]
+        for rootDepth in range(2, (chessAI.MAX_DEPTH if depth is None else depth) + 1):
+            if nodes is not None and nodeCounts[0] >= nodes:
+                break
+            first = rootMoves[0]
+            alpha = -chessAI.CHECKMATE if completedDepth < 2 else bestScore # no score to beat before depth 2 is done
+            firstNodes = None if nodes is None else max(1, (nodes - nodeCounts[0]) // 2) # the full window search costs the most
+            nodesPerMove = None if nodes is None else max(1, (nodes - nodeCounts[0]) // 2 // (len(rootMoves) - 1))
+            results = self.searchMoves(rootTask, rootDepth, first, rootMoves[1:], alpha, firstNodes, nodesPerMove, nodeCounts)
+            firstScore = results[first.moveID][0]
+            if firstScore is not None and not self.stopEvent.is_set():
+                # moves started before the best move's score was in were only asked whether they beat the old score
+                failedLow = [move for move in rootMoves[1:] if results[move.moveID][0] is not None
+                             and results[move.moveID][0] <= results[move.moveID][1] and results[move.moveID][1] > firstScore]
+                if failedLow:
+                    results.update(self.searchMoves(rootTask, rootDepth, None, failedLow, firstScore, None, nodesPerMove, nodeCounts))
+            finished = all(score is not None for score, moveAlpha, replyPV in results.values())
+            iterationBest = first
+            iterationScore = firstScore
+            for move in rootMoves[1:]:
+                score = results[move.moveID][0]
+                # above the window's alpha, so exact; with the best move unfinished only a mate can be trusted
+                if score is not None and (score >= chessAI.CHECKMATE if iterationScore is None else score > iterationScore):
+                    iterationBest = move
+                    iterationScore = score
+            if iterationScore is None:
+                break
+            # an unfinished iteration still counts when the moves it did finish beat the previous best
+            if finished or iterationBest == bestMove or iterationScore >= chessAI.CHECKMATE or \
+                    (firstScore is not None and iterationScore > firstScore):
+                bestMove = iterationBest
+                bestScore = iterationScore
+                bestPV = principalVariation(gs, bestMove, results[bestMove.moveID][2])
+                if finished:
+                    completedDepth = rootDepth
+            if not finished:
+                break
+            rootMoves.remove(bestMove)
+            rootMoves.insert(0, bestMove)
+            if bestScore >= chessAI.CHECKMATE:
+                break
+        stopped = self.stopEvent.is_set() and bestScore < chessAI.CHECKMATE
+        return chessAI.SearchResult(bestMove, bestScore, completedDepth, nodeCounts[0], nodeCounts[1],
+                                    time.time() - startTime, bestPV, 0.0, stopped)
+
+
+benchmarkPositions = [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+]
+
+
+# nodes/s for each worker count, with speedup and efficiency against one worker
+def benchmark(workerCounts, depth=4, backend='mailbox'):
+    rows = []
+    for workers in workerCounts:
+        nodes = 0
+        elapsed = 0.0
+        with ParallelSearcher(workers) as searcher:
+            for fen in benchmarkPositions:
+                gs = ChessEngine.newGameState(backend, fen)
+                result = searcher.search(gs, gs.getValidMoves(), depth=depth)
+                nodes += result.nodes
+                elapsed += result.time
+        nps = nodes / elapsed if elapsed > 0 else 0.0
+        speedup = nps / rows[0]['nps'] if rows else 1.0
+        rows.append({'workers': workers, 'nodes': nodes, 'time': elapsed, 'nps': nps,
+                     'speedup': speedup, 'efficiency': speedup * workerCounts[0] / workers})
+        print('%3d workers  %9d nodes  %7.2fs  %9.0f nodes/s  speedup %5.2f  efficiency %4.0f%%'
+              % (workers, nodes, elapsed, nps, speedup, 100 * rows[-1]['efficiency']))
+    return rows
+
+
+if __name__ == '__main__':
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Root-parallel search scaling benchmark')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--backend', default='mailbox', choices=ChessEngine.backends)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[n for n in (1, 2, 4, 8, 16) if n <= cores] + ([cores] if cores not in (1, 2, 4, 8, 16) else []))
+    args = parser.parse_args()
+    benchmark(args.workers, args.depth, args.backend)
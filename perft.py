@@ -0,0 +1,163 @@
+"""
+Perft - counts every leaf of the legal move tree to a fixed depth and checks the totals against known counts.
+Any bug in move generation, make or undo shows up as a wrong count, and divide splits a count by root move
+so the faulty branch can be found. Also reports nodes per second and can act as a regression gate:
+
+    python perft.py                          run the suite on the mailbox backend
+    python perft.py --backend all --gate     fail on a wrong count or a throughput drop against perftBaseline.json
+    python perft.py --fen "<fen>" --depth 3 --divide
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import ChessEngine
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perftBaseline.json')
+THROUGHPUT_TOLERANCE = 0.25 # the gate allows nodes/s to drop this far below the baseline before failing
+
+# name, FEN, leaf counts for depth 1, 2, 3... and the depth the gate runs it to
+# the engine always promotes to a queen, so these counts leave out under-promotions - they match the
+# published numbers wherever no promotion happens within the depth (all of start and position3)
+perftPositions = [
+    ('start', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+        [20, 400, 8902, 197281, 4865609], 4),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+        [48, 2039, 97862, 4074224], 3),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+        [14, 191, 2812, 43238, 674624], 4),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+        [6, 228, 8087, 320802], 3),
+    ('position4mirrored', 'r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1',
+        [6, 228, 8087, 320802], 3),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+        [41, 1373, 54007, 1806790], 3),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+        [46, 2079, 89890, 3894594], 3),
+]
+
+
+# number of leaf nodes depth plies below gs, the last ply is counted from the move list without being played
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+# perft split by root move, returns {move notation: leaf count}
+def divide(gs, depth):
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts[move.getChessNotation()] = perft(gs, depth - 1)
+        gs.undoMove()
+    return counts
+
+
+# runs every position to its gate depth (or to depth when given) and returns one result dict per position
+def runSuite(backend, depth=None, out=None):
+    results = []
+    for name, fen, expected, gateDepth in perftPositions:
+        d = min(depth, len(expected)) if depth is not None else gateDepth
+        gs = ChessEngine.newGameState(backend, fen)
+        start = time.perf_counter()
+        nodes = perft(gs, d)
+        elapsed = time.perf_counter() - start
+        result = {'name': name, 'depth': d, 'nodes': nodes, 'expected': expected[d - 1],
+                  'time': elapsed, 'nps': nodes / elapsed if elapsed > 0 else 0.0}
+        results.append(result)
+        if out is not None:
+            status = 'ok' if nodes == expected[d - 1] else 'MISMATCH expected ' + str(expected[d - 1])
+            print('%-8s %-18s depth %d  %10d nodes  %7.2fs  %9.0f nodes/s  %s'
+                  % (backend, name, d, nodes, elapsed, result['nps'], status), file=out)
+    return results
+
+
+# total nodes over total time, so one fast position can not hide a slow one
+def suiteThroughput(results):
+    totalTime = sum(result['time'] for result in results)
+    return sum(result['nodes'] for result in results) / totalTime if totalTime > 0 else 0.0
+
+
+def loadBaseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# checks one backend's results, returns a list of failure messages (empty when it passed)
+def gateFailures(backend, results, baseline, tolerance=THROUGHPUT_TOLERANCE):
+    failures = []
+    for result in results:
+        if result['nodes'] != result['expected']:
+            failures.append('%s %s depth %d: %d nodes, expected %d'
+                            % (backend, result['name'], result['depth'], result['nodes'], result['expected']))
+    if backend in baseline:
+        nps = suiteThroughput(results)
+        floor = baseline[backend] * (1 - tolerance)
+        if nps < floor:
+            failures.append('%s: %.0f nodes/s is below the baseline %.0f (allowed down to %.0f)'
+                            % (backend, nps, baseline[backend], floor))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perft move generation test and benchmark')
+    parser.add_argument('--backend', default='mailbox', choices=ChessEngine.backends + ('all',))
+    parser.add_argument('--depth', type=int, help='depth for every position (default: each position\'s gate depth)')
+    parser.add_argument('--fen', help='run a single position instead of the suite')
+    parser.add_argument('--divide', action='store_true', help='with --fen, print the count for every root move')
+    parser.add_argument('--gate', action='store_true', help='exit nonzero on a wrong count or a throughput drop')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run\'s nodes/s as the baseline')
+    parser.add_argument('--tolerance', type=float, default=THROUGHPUT_TOLERANCE)
+    args = parser.parse_args(argv)
+    backendList = ChessEngine.backends if args.backend == 'all' else (args.backend,)
+
+    if args.fen is not None:
+        depth = args.depth or 1
+        for backend in backendList:
+            gs = ChessEngine.newGameState(backend, args.fen)
+            start = time.perf_counter()
+            if args.divide:
+                counts = divide(gs, depth)
+                for notation in sorted(counts):
+                    print(notation, counts[notation])
+                nodes = sum(counts.values())
+            else:
+                nodes = perft(gs, depth)
+            elapsed = time.perf_counter() - start
+            print('%s depth %d: %d nodes in %.2fs, %.0f nodes/s'
+                  % (backend, depth, nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0))
+        return 0
+
+    baseline = loadBaseline()
+    failures = []
+    for backend in backendList:
+        results = runSuite(backend, args.depth, sys.stdout)
+        print('%-8s total %.0f nodes/s' % (backend, suiteThroughput(results)))
+        if args.save_baseline:
+            baseline[backend] = round(suiteThroughput(results))
+        if args.gate:
+            failures += gateFailures(backend, results, baseline, args.tolerance)
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+    for failure in failures:
+        print('FAIL', failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
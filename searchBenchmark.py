@@ -0,0 +1,58 @@
+"""
+Search benchmark - time to depth on a fixed set of positions, full width against the selective search
+(PVS, null-move pruning, late move reductions and aspiration windows, Searcher.pruning).
+Both run the same iterative deepening from a fresh Searcher, so the times include every shallower iteration.
+
+    python searchBenchmark.py [--depth 6] [--plain-depth 3] [--backend mailbox]
+"""
+
+import argparse
+import ChessEngine, chessAI, perft
+
+benchmarkPositions = [(name, fen) for name, fen, counts, gateDepth in perft.perftPositions] + [
+    ('italian', 'r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/3P1N2/PPP2PPP/RNBQK2R w KQkq - 0 5'),
+    ('sicilian', 'r1b1kb1r/1pqp1ppp/p1n1pn2/8/3NP3/2N1B3/PPP1BPPP/R2QK2R w KQkq - 0 8'),
+    ('queensgambit', 'r1bq1rk1/pp2bppp/2n1pn2/2pp4/2PP4/2N1PN2/PP2BPPP/R1BQ1RK1 w - - 0 8'),
+    ('rookending', '8/5pk1/6p1/3R4/r4P2/6P1/5K2/8 w - - 0 40'),
+]
+
+
+# [(depth, seconds, nodes)] for every iteration of one search of fen to depth
+def timeToDepth(backend, fen, depth, pruning):
+    gs = ChessEngine.newGameState(backend, fen)
+    searcher = chessAI.Searcher()
+    searcher.pruning = pruning
+    iterations = []
+    searcher.onIteration = lambda result: iterations.append((result.depth, result.time, result.nodes))
+    searcher.search(gs, gs.getValidMoves(), depth=depth)
+    return iterations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time to depth with and without the selective search')
+    parser.add_argument('--depth', type=int, default=6, help='depth of the selective search')
+    parser.add_argument('--plain-depth', dest='plainDepth', type=int, default=3, help='depth of the full width search')
+    parser.add_argument('--backend', default='mailbox', choices=ChessEngine.backends)
+    args = parser.parse_args(argv)
+    totals = {}
+    for name, fen in benchmarkPositions:
+        for pruning, depth in ((False, args.plainDepth), (True, args.depth)):
+            iterations = timeToDepth(args.backend, fen, depth, pruning)
+            print('%-18s %-9s ' % (name, 'selective' if pruning else 'plain')
+                  + '  '.join('d%d %6.2fs' % (d, seconds) for d, seconds, nodes in iterations))
+            for d, seconds, nodes in iterations:
+                total = totals.setdefault((pruning, d), [0.0, 0])
+                total[0] += seconds
+                total[1] += nodes
+    print()
+    for (pruning, depth), (seconds, nodes) in sorted(totals.items()):
+        print('%-9s depth %d  %8.2fs  %9d nodes' % ('selective' if pruning else 'plain', depth, seconds, nodes))
+    plainSeconds = totals[(False, args.plainDepth)][0]
+    reached = max([depth for (pruning, depth), (seconds, nodes) in totals.items() if pruning and seconds <= plainSeconds],
+                  default=0)
+    print('the selective search reaches depth %d in the %.2fs full width takes to depth %d'
+          % (reached, plainSeconds, args.plainDepth))
+
+
+if __name__ == '__main__':
+    main()
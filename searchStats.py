@@ -0,0 +1,278 @@
+"""
+Search instrumentation - per search statistics and an opt-in sampling profiler for chessAI.Searcher.
+Set searcher.instrumentation to an Instrumentation and every search adds a SearchStats to its SearchResult as
+result.stats: nodes, nodes per second, effective branching factor, cutoff and cache hit rates, and the time spent
+in move generation, evaluation and make/undo. With a sink each one is also written out as a line of JSON, and
+with a SamplingProfiler the search's stacks are sampled for a flame graph (flamegraph.pl, speedscope, inferno).
+Left at None it costs one attribute test per search.
+
+Instrumenting wraps methods of the searched GameState, the Searcher and its tables for the length of the search,
+which slows it down - the time split is accurate as a proportion, not in absolute terms. Nothing module wide is
+replaced, so other Searchers running alongside are neither slowed nor counted, unless they share the table.
+
+    python searchStats.py [--fen FEN] [--depth 5] [--json stats.jsonl] [--profile search.folded]
+"""
+
+import argparse
+import collections
+import json
+import math
+import os
+import sys
+import threading
+import time
+import ChessEngine, chessAI
+
+# what is timed in every instrumented search, by the part of the search it belongs to
+timedMethods = {
+    'getValidMoves': 'moveGeneration',
+    'getValidCaptures': 'moveGeneration',
+    'squareUnderAttack': 'moveGeneration',
+    'inCheck': 'moveGeneration',
+    'makeMove': 'makeUndo',
+    'undoMove': 'makeUndo',
+    'makeNullMove': 'makeUndo',
+    'undoNullMove': 'makeUndo',
+    'scoreBoard': 'evaluation',
+    'staticExchangeEvaluation': 'ordering',
+    'orderMoves': 'ordering',
+    'hashProbe': 'hashTable',
+    'hashStore': 'hashTable',
+    'tablebaseProbe': 'tablebase',
+}
+# Searcher attributes timed, by the name they are timed under
+searcherFunctions = {'evaluate': 'scoreBoard', 'staticExchange': 'staticExchangeEvaluation', 'orderMoves': 'orderMoves'}
+instrumentationFrames = ('wrapper', 'hashProbe', 'tablebaseProbe', 'recordIteration') # left out of sampled stacks
+
+
+# what one instrumented search did; times are exclusive, a function's own time without the timed calls it made
+class SearchStats():
+    def __init__(self):
+        self.fen = None
+        self.bestMove = None
+        self.score = 0
+        self.depth = 0
+        self.nodes = 0
+        self.quiescenceNodes = 0
+        self.time = 0.0
+        self.iterations = [] # (depth, nodes, seconds) for every finished depth, counted from the start of the search
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.hashProbes = 0
+        self.hashHits = 0
+        self.tablebaseProbes = 0
+        self.tablebaseHits = 0
+        self.calls = collections.Counter() # by function name
+        self.seconds = collections.Counter() # by function name
+
+    def nodesPerSecond(self):
+        return self.nodes / self.time if self.time > 0 else 0.0
+
+    # geometric mean of how many times more nodes each depth took than the one before
+    def branchingFactor(self):
+        cumulative = [nodes for depth, nodes, seconds in self.iterations]
+        perDepth = [nodes - last for nodes, last in zip(cumulative, [0] + cumulative)]
+        ratios = [nodes / last for last, nodes in zip(perDepth, perDepth[1:]) if last > 0 and nodes > 0]
+        return math.exp(sum(map(math.log, ratios)) / len(ratios)) if ratios else 0.0
+
+    # fraction of the full width nodes (quiescence left out) that ended in a beta cutoff
+    def cutoffRate(self):
+        interior = self.nodes - self.quiescenceNodes
+        return self.cutoffs / interior if interior else 0.0
+
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def hashHitRate(self):
+        return self.hashHits / self.hashProbes if self.hashProbes else 0.0
+
+    # seconds by part of the search, the search's own bookkeeping counts as 'search'
+    def timeSplit(self):
+        split = collections.Counter()
+        for name, seconds in self.seconds.items():
+            split[timedMethods.get(name, name)] += seconds
+        split['search'] = max(0.0, self.time - sum(split.values()))
+        return dict(split)
+
+    def toDict(self):
+        return {'fen': self.fen, 'bestMove': self.bestMove, 'score': self.score, 'depth': self.depth,
+                'nodes': self.nodes, 'quiescenceNodes': self.quiescenceNodes, 'time': round(self.time, 6),
+                'nps': round(self.nodesPerSecond()), 'branchingFactor': round(self.branchingFactor(), 3),
+                'iterations': [{'depth': d, 'nodes': n, 'time': round(s, 6)} for d, n, s in self.iterations],
+                'cutoffRate': round(self.cutoffRate(), 4), 'firstMoveCutoffRate': round(self.firstMoveCutoffRate(), 4),
+                'hashProbes': self.hashProbes, 'hashHitRate': round(self.hashHitRate(), 4),
+                'tablebaseProbes': self.tablebaseProbes, 'tablebaseHits': self.tablebaseHits,
+                'timeSplit': {part: round(seconds, 6) for part, seconds in self.timeSplit().items()},
+                'functions': {name: {'calls': self.calls[name], 'time': round(self.seconds[name], 6)}
+                              for name in sorted(self.calls)}}
+
+    # a few lines for a person to read
+    def report(self):
+        lines = ['depth %d  score %s  best %s' % (self.depth, self.score, self.bestMove),
+                 'nodes %d (%d quiescence)  %.2fs  %.0f nodes/s  branching factor %.2f'
+                 % (self.nodes, self.quiescenceNodes, self.time, self.nodesPerSecond(), self.branchingFactor()),
+                 'cutoffs %.1f%% of full width nodes, %.1f%% on the first move  hash hits %.1f%% of %d probes'
+                 % (100 * self.cutoffRate(), 100 * self.firstMoveCutoffRate(), 100 * self.hashHitRate(), self.hashProbes)]
+        if self.tablebaseProbes:
+            lines.append('tablebase hits %d of %d probes' % (self.tablebaseHits, self.tablebaseProbes))
+        split = self.timeSplit()
+        lines.append('time  ' + '  '.join('%s %.1f%%' % (part, 100 * seconds / self.time if self.time else 0.0)
+                                          for part, seconds in sorted(split.items(), key=lambda item: -item[1])))
+        for name in sorted(self.calls, key=lambda name: -self.seconds[name]):
+            lines.append('  %-24s %9d calls  %7.3fs' % (name, self.calls[name], self.seconds[name]))
+        return '\n'.join(lines)
+
+
+# samples the stack of one thread at a fixed interval and counts identical stacks, written out in the collapsed
+# format flame graph tools read - one 'outermost;...;innermost count' line per stack
+# the sampler needs the GIL to look, so it samples at most every sys.getswitchinterval() (5ms) while the search runs
+class SamplingProfiler():
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.thread = None
+        self.stopEvent = threading.Event()
+
+    def start(self, threadID=None):
+        targetID = threading.get_ident() if threadID is None else threadID
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.sample, args=(targetID,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def sample(self, targetID):
+        while not self.stopEvent.wait(self.interval):
+            frame = sys._current_frames().get(targetID)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_name not in instrumentationFrames or code.co_filename != __file__: # leave out the timing wrappers
+                    stack.append('%s.%s' % (os.path.splitext(os.path.basename(code.co_filename))[0],
+                                            getattr(code, 'co_qualname', code.co_name)))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def writeCollapsed(self, f):
+        for stack, count in sorted(self.samples.items()):
+            f.write('%s %d\n' % (stack, count))
+
+
+# turns per search statistics on for a Searcher, see the module docstring
+# sink is a file each search's SearchStats is written to as a line of JSON
+class Instrumentation():
+    def __init__(self, sink=None, profiler=None):
+        self.sink = sink
+        self.profiler = profiler
+
+    # chessAI.Searcher.iterativeDeepening with everything counted and timed, the result carries the stats
+    def run(self, searcher, gs, validMoves, alpha, beta):
+        stats = SearchStats()
+        stats.fen = gs.toFEN()
+        patched = [] # (object, attribute name, the instance's own value or None) of every wrapper installed
+        stack = [0.0] # time spent in timed calls below each timed call in progress, the exclusive time bookkeeping
+
+        def timed(name, function):
+            def wrapper(*args, **kwargs):
+                stack.append(0.0)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    stats.calls[name] += 1
+                    stats.seconds[name] += elapsed - stack.pop()
+                    stack[-1] += elapsed
+            return wrapper
+
+        def patch(target, name, wrapper):
+            patched.append((target, name, vars(target).get(name)))
+            setattr(target, name, wrapper)
+
+        for name in timedMethods:
+            if hasattr(gs, name):
+                patch(gs, name, timed(name, getattr(gs, name)))
+        for attribute, name in searcherFunctions.items():
+            patch(searcher, attribute, timed(name, getattr(searcher, attribute)))
+        table = searcher.transpositionTable
+        def hashProbe(key, probe=timed('hashProbe', table.probe)):
+            entry = probe(key)
+            stats.hashProbes += 1
+            stats.hashHits += entry is not None
+            return entry
+        patch(table, 'probe', hashProbe)
+        patch(table, 'store', timed('hashStore', table.store))
+        if searcher.tablebases is not None:
+            tablebases = searcher.tablebases
+            def tablebaseProbe(position, probe=timed('tablebaseProbe', tablebases.probe)):
+                result = probe(position)
+                stats.tablebaseProbes += 1
+                stats.tablebaseHits += result is not None
+                return result
+            patch(tablebases, 'probe', tablebaseProbe)
+        onIteration = searcher.onIteration
+        def recordIteration(result):
+            stats.iterations.append((result.depth, result.nodes, result.time))
+            if onIteration is not None:
+                onIteration(result)
+        searcher.onIteration = recordIteration
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            result = searcher.searchIterations(gs, validMoves, alpha, beta)
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+            searcher.onIteration = onIteration
+            for target, name, own in reversed(patched):
+                if own is None:
+                    delattr(target, name) # the class's method shows through again
+                else:
+                    setattr(target, name, own)
+        stats.bestMove = None if result.bestMove is None else result.bestMove.getChessNotation()
+        stats.score = result.score
+        stats.depth = result.depth
+        stats.nodes = result.nodes
+        stats.quiescenceNodes = result.quiescenceNodes
+        stats.time = result.time
+        stats.cutoffs = searcher.cutoffs
+        stats.firstMoveCutoffs = searcher.firstMoveCutoffs
+        result.stats = stats
+        if self.sink is not None:
+            self.sink.write(json.dumps(stats.toDict()) + '\n')
+            self.sink.flush()
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search one position with instrumentation and print its statistics')
+    parser.add_argument('--fen', default='r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--movetime', type=float, help='seconds, instead of a fixed depth')
+    parser.add_argument('--backend', default='mailbox', choices=ChessEngine.backends)
+    parser.add_argument('--json', help='append the statistics to this file as a line of JSON')
+    parser.add_argument('--profile', help='write sampled stacks here in collapsed format, for a flame graph')
+    parser.add_argument('--interval', type=float, default=0.001, help='seconds between profiler samples')
+    args = parser.parse_args(argv)
+    gs = ChessEngine.newGameState(args.backend, args.fen)
+    sink = open(args.json, 'a') if args.json else None
+    profiler = SamplingProfiler(args.interval) if args.profile else None
+    searcher = chessAI.Searcher()
+    searcher.instrumentation = Instrumentation(sink, profiler)
+    result = searcher.search(gs, gs.getValidMoves(), None if args.movetime else args.depth, args.movetime)
+    print(result.stats.report())
+    if sink is not None:
+        sink.close()
+    if profiler is not None:
+        with open(args.profile, 'w') as f:
+            profiler.writeCollapsed(f)
+        print('%d samples written to %s' % (sum(profiler.samples.values()), args.profile))
+
+
+if __name__ == '__main__':
+    main()
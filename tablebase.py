@@ -0,0 +1,651 @@
+"""
+Endgame tablebases for up to four pieces, built locally by retrograde analysis.
+Every position of a material set (KQvK, KRvK, KPvK, KBNvK, KQvKR...) gets its exact result for the side to move -
+win, loss or draw - and the distance to mate in plies. The search looks positions up instead of searching them,
+so won endings are converted by the shortest mate instead of being shuffled around.
+
+Generation starts from the checkmates and works backwards one ply at a time: a position is won in n + 1 if some move
+reaches a position lost in n, and lost in n + 1 once every move reaches a position won in n or less. Captures and
+promotions leave the material set, their results come from the smaller tables, which are generated first.
+The work of each ply is split across a process pool sharing the table being built.
+
+A table is stored as one code per position, bit packed at the fewest bits its longest mate needs, behind a 32 byte
+header, and probed through mmap. Code 0 is a draw (or an illegal position), code d + 1 a result d plies from mate -
+odd d is a win for the side to move, even d a loss. Positions with castling rights or an en passant square are
+never probed, and the tables assume neither.
+
+    python tablebase.py generate KQK KRK KPK KBNK [--workers 4] [--dir tablebases]
+    python tablebase.py probe "<fen>" [--dir tablebases]
+"""
+
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+import ChessEngine
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+MAX_PIECES = 4
+headerStruct = struct.Struct('<4sHH16sQ') # magic, version, bits per position, material name, positions
+MAGIC = b'CATB'
+VERSION = 1
+
+# working values while a table is built, resolved positions hold their distance to mate in plies
+UNKNOWN = -1
+ILLEGAL = -2
+DRAWN = -3 # stalemates, never to be marked lost by the counting rule
+
+kindOrder = 'KQRBNP' # order of the pieces within one side of a material name
+kindValues = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+
+# square tables, a square is r * 8 + c like GameState.board
+def onBoard(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+def stepTargets(steps):
+    return [[(r + dr) * 8 + c + dc for dr, dc in steps if onBoard(r + dr, c + dc)] for r in range(8) for c in range(8)]
+
+kingSteps = stepTargets([(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc])
+knightSteps = stepTargets([(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)])
+kingSets = [set(targets) for targets in kingSteps]
+knightSets = [set(targets) for targets in knightSteps]
+pawnCaptureSets = {'w': stepTargets([(-1, -1), (-1, 1)]), 'b': stepTargets([(1, -1), (1, 1)])}
+pawnCaptureSets = {color: [set(targets) for targets in table] for color, table in pawnCaptureSets.items()}
+rookDirections = ((-1, 0), (1, 0), (0, -1), (0, 1))
+bishopDirections = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+slideDirections = {'R': rookDirections, 'B': bishopDirections, 'Q': rookDirections + bishopDirections}
+
+def buildRays(dr, dc):
+    rays = []
+    for r in range(8):
+        for c in range(8):
+            ray = []
+            rr, cc = r + dr, c + dc
+            while onBoard(rr, cc):
+                ray.append(rr * 8 + cc)
+                rr, cc = rr + dr, cc + dc
+            rays.append(ray)
+    return rays
+
+rays = {direction: buildRays(*direction) for direction in rookDirections + bishopDirections}
+# the squares strictly between two squares on one line and the kind of line, for slider attacks
+between = [[None] * 64 for _ in range(64)]
+lineKind = [[None] * 64 for _ in range(64)]
+for _direction, _rays in rays.items():
+    for _sq in range(64):
+        for _i, _target in enumerate(_rays[_sq]):
+            between[_sq][_target] = _rays[_sq][:_i]
+            lineKind[_sq][_target] = 'R' if _direction in rookDirections else 'B'
+
+# the 8 symmetries of the board as square maps, identity first
+symmetries = []
+for _swap in (False, True):
+    for _flipRank in (False, True):
+        for _flipFile in (False, True):
+            _map = []
+            for _sq in range(64):
+                r, c = divmod(_sq, 8)
+                if _swap:
+                    r, c = c, r
+                if _flipRank:
+                    r = 7 - r
+                if _flipFile:
+                    c = 7 - c
+                _map.append(r * 8 + c)
+            symmetries.append(_map)
+symmetries.sort(key=lambda m: m != list(range(64)))
+fileMirror = [(sq // 8) * 8 + 7 - sq % 8 for sq in range(64)]
+rankMirror = [(7 - sq // 8) * 8 + sq % 8 for sq in range(64)]
+diagonalMirror = [(7 - sq % 8) * 8 + 7 - sq // 8 for sq in range(64)] # reflects in the a1-h8 diagonal
+
+# white king squares the index keeps - a1-d1-d4 triangle without pawns, files a-d with them
+triangleSquares = [r * 8 + c for r in range(8) for c in range(4) if 7 - r <= c]
+halfSquares = [r * 8 + c for r in range(8) for c in range(4)]
+
+def buildKingCanon(slotSquares, candidateMaps):
+    canon = []
+    for sq in range(64):
+        for squareMap in candidateMaps:
+            if squareMap[sq] in slotSquares:
+                canon.append((squareMap, slotSquares.index(squareMap[sq])))
+                break
+    return canon
+
+pawnlessCanon = buildKingCanon(triangleSquares, symmetries) # (square map, king slot) for every white king square
+pawnCanon = buildKingCanon(halfSquares, [list(range(64)), fileMirror])
+
+
+# splits 'KQvK', 'KQK' or 'kqk' into ('KQ', 'K') with every side in kindOrder
+def parseMaterial(name):
+    name = name.upper()
+    if 'V' in name:
+        white, black = name.split('V')
+    else:
+        second = name.find('K', 1)
+        if not name.startswith('K') or second < 0:
+            raise ValueError('material has to be like KQK or KQvK: ' + name)
+        white, black = name[:second], name[second:]
+    for side in (white, black):
+        if not side.startswith('K') or side.count('K') != 1 or any(kind not in kindOrder for kind in side):
+            raise ValueError('material has to be like KQK or KQvK: ' + name)
+    return ''.join(sorted(white, key=kindOrder.index)), ''.join(sorted(black, key=kindOrder.index))
+
+
+# the name a material set is stored under, the side with more material as white
+def materialName(white, black):
+    if (sum(kindValues[k] for k in black), black) > (sum(kindValues[k] for k in white), white):
+        white, black = black, white
+    return white + 'v' + black
+
+
+# the material sets a table's captures and promotions lead to, excluding bare kings
+def dependencies(name):
+    white, black = parseMaterial(name)
+    found = set()
+    for side, other, isWhite in ((white, black, True), (black, white, False)):
+        for i in range(1, len(side)):
+            smaller = side[:i] + side[i + 1:]
+            if side[i] == 'P':
+                promoted = ''.join(sorted(smaller + 'Q', key=kindOrder.index))
+                found.add(materialName(promoted, other) if isWhite else materialName(other, promoted))
+            if len(smaller) + len(other) > 2:
+                found.add(materialName(smaller, other) if isWhite else materialName(other, smaller))
+    return found
+
+
+# layout of one table - piece list, index size and the square to index mapping
+class TableSpec():
+    def __init__(self, name):
+        white, black = parseMaterial(name)
+        self.name = white + 'v' + black
+        # engine piece codes, where a pawn is 'wp'
+        self.pieces = tuple('w' + kind for kind in white.replace('P', 'p'))
+        self.pieces += tuple('b' + kind for kind in black.replace('P', 'p'))
+        self.hasPawns = 'P' in white + black
+        self.kingCanon = pawnCanon if self.hasPawns else pawnlessCanon
+        self.slotSquares = halfSquares if self.hasPawns else triangleSquares
+        self.kingSlots = len(self.slotSquares)
+        self.others = len(self.pieces) - 1
+        self.size = 2 * self.kingSlots * 64 ** self.others
+
+    # index of a position given as squares in self.pieces order, white or black to move
+    def index(self, squares, white):
+        squareMap, slot = self.kingCanon[squares[0]]
+        index = (0 if white else self.kingSlots) + slot
+        for sq in squares[1:]:
+            index = index * 64 + squareMap[sq]
+        return index
+
+    # every index of a position - two when the white king stands on the a1-h8 diagonal without pawns, as reflecting
+    # the board in that diagonal keeps the king in the triangle
+    def indices(self, squares, white):
+        index = self.index(squares, white)
+        squareMap = self.kingCanon[squares[0]][0]
+        king = squareMap[squares[0]]
+        if self.hasPawns or king // 8 + king % 8 != 7:
+            return (index,)
+        return index, self.index([diagonalMirror[squareMap[sq]] for sq in squares], white)
+
+    # (squares, white) of an index, the white king in its canonical region
+    def position(self, index):
+        squares = []
+        for _ in range(self.others):
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        white = index < self.kingSlots
+        squares.append(self.slotSquares[index % self.kingSlots])
+        squares.reverse()
+        return squares, white
+
+
+# True when any piece of byColor attacks sq
+def attacked(pieces, squares, sq, byColor):
+    occupied = set(squares)
+    for piece, fromSq in zip(pieces, squares):
+        if piece[0] != byColor or fromSq == sq:
+            continue
+        kind = piece[1]
+        if kind == 'K':
+            if sq in kingSets[fromSq]:
+                return True
+        elif kind == 'N':
+            if sq in knightSets[fromSq]:
+                return True
+        elif kind == 'p':
+            if sq in pawnCaptureSets[byColor][fromSq]:
+                return True
+        else:
+            line = lineKind[fromSq][sq]
+            if line is not None and (kind == 'Q' or kind == line):
+                if not any(s in occupied for s in between[fromSq][sq]):
+                    return True
+    return False
+
+
+def kingInCheck(pieces, squares, color):
+    return attacked(pieces, squares, squares[pieces.index(color + 'K')], 'b' if color == 'w' else 'w')
+
+
+# no two pieces on a square, no pawn on the first or last rank and the side not to move not in check
+def isLegal(pieces, squares, white):
+    if len(set(squares)) != len(squares):
+        return False
+    for piece, sq in zip(pieces, squares):
+        if piece[1] == 'p' and (sq < 8 or sq >= 56):
+            return False
+    return not kingInCheck(pieces, squares, 'b' if white else 'w')
+
+
+# every legal move as (pieces, squares, converted) of the position after it, converted when a capture or promotion
+# changed the material; pieces keep their order, a captured piece is dropped and a promoted pawn becomes a queen
+def legalMoves(pieces, squares, white):
+    color = 'w' if white else 'b'
+    occupant = {sq: i for i, sq in enumerate(squares)}
+    children = []
+    for i, piece in enumerate(pieces):
+        if piece[0] != color:
+            continue
+        kind = piece[1]
+        fromSq = squares[i]
+        if kind == 'K':
+            targets = kingSteps[fromSq]
+        elif kind == 'N':
+            targets = knightSteps[fromSq]
+        elif kind == 'p':
+            step = -8 if white else 8
+            targets = []
+            if fromSq + step not in occupant:
+                targets.append(fromSq + step)
+                startRow = 6 if white else 1
+                if fromSq // 8 == startRow and fromSq + 2 * step not in occupant:
+                    targets.append(fromSq + 2 * step)
+            targets += [sq for sq in pawnCaptureSets[color][fromSq] if sq in occupant]
+        else:
+            targets = []
+            for direction in slideDirections[kind]:
+                for sq in rays[direction][fromSq]:
+                    targets.append(sq)
+                    if sq in occupant:
+                        break
+        for target in targets:
+            j = occupant.get(target)
+            if j is not None and (pieces[j][0] == color or pieces[j][1] == 'K'):
+                continue
+            newSquares = list(squares)
+            newSquares[i] = target
+            newPieces = pieces
+            converted = False
+            if kind == 'p' and (target < 8 or target >= 56): # always a queen, like the engine
+                newPieces = pieces[:i] + (color + 'Q',) + pieces[i + 1:]
+                converted = True
+            if j is not None:
+                newPieces = newPieces[:j] + newPieces[j + 1:]
+                del newSquares[j]
+                converted = True
+            if not kingInCheck(newPieces, newSquares, color):
+                children.append((newPieces, newSquares, converted))
+    return children
+
+
+# positions one move before this one within the same material, as (squares, white) - the side that just moved
+# takes back a move that captured and promoted nothing
+def previousPositions(pieces, squares, white):
+    color = 'b' if white else 'w' # the side that made the last move
+    occupied = set(squares)
+    previous = []
+    for i, piece in enumerate(pieces):
+        if piece[0] != color:
+            continue
+        kind = piece[1]
+        toSq = squares[i]
+        if kind == 'K':
+            origins = [sq for sq in kingSteps[toSq] if sq not in occupied]
+        elif kind == 'N':
+            origins = [sq for sq in knightSteps[toSq] if sq not in occupied]
+        elif kind == 'p':
+            back = 8 if color == 'w' else -8
+            origins = []
+            origin = toSq + back
+            if 8 <= origin < 56 and origin not in occupied:
+                origins.append(origin)
+                startRow = 6 if color == 'w' else 1
+                if (origin + back) // 8 == startRow and origin + back not in occupied:
+                    origins.append(origin + back)
+        else:
+            origins = []
+            for direction in slideDirections[kind]:
+                for sq in rays[direction][toSq]:
+                    if sq in occupied:
+                        break
+                    origins.append(sq)
+        for origin in origins:
+            newSquares = list(squares)
+            newSquares[i] = origin
+            if not kingInCheck(pieces, newSquares, 'w' if color == 'b' else 'b'): # the other side is not left in check
+                previous.append((newSquares, not white))
+    return previous
+
+
+# result for the side to move from a stored code, (1 win, -1 loss or 0 draw, plies to mate)
+def decodeResult(code):
+    if code <= 0:
+        return 0, 0
+    plies = code - 1
+    return (1 if plies % 2 else -1), plies
+
+
+# the tables of a directory, memory mapped and probed by position
+class Tablebases():
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.tables = {}
+        self.maxPieces = 0
+        if os.path.isdir(directory):
+            for fileName in sorted(os.listdir(directory)):
+                if fileName.endswith('.tb'):
+                    self.load(os.path.join(directory, fileName))
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, bits, name, size = headerStruct.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            data.close()
+            raise ValueError('not a tablebase file: ' + path)
+        spec = TableSpec(name.rstrip(b'\0').decode())
+        self.tables[spec.name] = (spec, data, bits, (1 << bits) - 1)
+        self.maxPieces = max(self.maxPieces, len(spec.pieces))
+
+    def close(self):
+        for spec, data, bits, mask in self.tables.values():
+            data.close()
+        self.tables = {}
+
+    def code(self, name, index):
+        spec, data, bits, mask = self.tables[name]
+        bit = index * bits
+        start = headerStruct.size + (bit >> 3)
+        return (int.from_bytes(data[start:start + 3], 'little') >> (bit & 7)) & mask
+
+    # (result, plies) for pieces on squares in any order, None when no table covers the material
+    def probePieces(self, pieces, squares, white):
+        whiteSide = ''.join(sorted((piece[1].upper() for piece in pieces if piece[0] == 'w'), key=kindOrder.index))
+        blackSide = ''.join(sorted((piece[1].upper() for piece in pieces if piece[0] == 'b'), key=kindOrder.index))
+        if whiteSide == 'K' and blackSide == 'K':
+            return 0, 0
+        name = whiteSide + 'v' + blackSide
+        if name not in self.tables: # stored with the colours the other way round, so flip the board
+            name = blackSide + 'v' + whiteSide
+            if name not in self.tables:
+                return None
+            pieces = [('b' if piece[0] == 'w' else 'w') + piece[1] for piece in pieces]
+            squares = [rankMirror[sq] for sq in squares]
+            white = not white
+        spec = self.tables[name][0]
+        order = sorted(range(len(pieces)), key=lambda i: (pieces[i][0] == 'b', kindOrder.index(pieces[i][1].upper())))
+        return decodeResult(self.code(name, spec.index([squares[i] for i in order], white)))
+
+    # (result, plies) for the side to move of a GameState, None when it is not covered
+    def probe(self, gs):
+        rights = gs.currentCastlingRights
+        if rights.wks or rights.wqs or rights.bks or rights.bqs:
+            return None
+        if gs.enpassantPossible != (): # set after every double push, but the tables only lack it when a pawn can take
+            row, col = gs.enpassantPossible
+            pawnRow, capturer = (row + 1, 'wp') if gs.whiteToMove else (row - 1, 'bp')
+            if (col > 0 and gs.board[pawnRow][col - 1] == capturer) or (col < 7 and gs.board[pawnRow][col + 1] == capturer):
+                return None
+        pieces = []
+        squares = []
+        sq = 0
+        for row in gs.board:
+            for piece in row:
+                if piece != '--':
+                    if len(pieces) == self.maxPieces:
+                        return None
+                    pieces.append(piece)
+                    squares.append(sq)
+                sq += 1
+        return self.probePieces(pieces, squares, gs.whiteToMove)
+
+
+# worker state while one table is generated - its layout, the shared working table and the finished smaller tables
+workerSpec = None
+workerTable = None
+workerMemory = None
+workerTablebases = None
+
+
+def initWorker(name, memoryName, directory):
+    global workerSpec, workerTable, workerMemory, workerTablebases
+    workerSpec = TableSpec(name)
+    workerMemory = shared_memory.SharedMemory(name=memoryName)
+    workerTable = workerMemory.buf[:workerSpec.size * 2].cast('h')
+    workerTablebases = Tablebases(directory)
+
+
+# undoes initWorker when the generation ran in this process
+def closeWorker():
+    global workerSpec, workerTable, workerMemory, workerTablebases
+    workerTable.release()
+    workerMemory.close()
+    workerTablebases.close()
+    workerSpec = workerTable = workerMemory = workerTablebases = None
+
+
+# the ply distance and result (1 or -1) of a move's outcome for the side that moved into it, None while unknown
+def childResult(pieces, squares, white, converted):
+    if converted:
+        result, plies = workerTablebases.probePieces(pieces, squares, white)
+        return (-result, plies) if result else None
+    value = workerTable[workerSpec.index(squares, white)]
+    if value < 0:
+        return None
+    return (1 if value % 2 == 0 else -1), value # the opponent is lost in an even number of plies
+
+
+# first pass over a range of indices: marks illegal positions, mates and stalemates, and returns the mates and
+# (level, index, win) for every capture or promotion whose result is already known from a smaller table
+def initRange(bounds):
+    spec = workerSpec
+    table = workerTable
+    pieces = spec.pieces
+    mates = []
+    events = []
+    for index in range(*bounds):
+        squares, white = spec.position(index)
+        if not isLegal(pieces, squares, white):
+            table[index] = ILLEGAL
+            continue
+        children = legalMoves(pieces, squares, white)
+        if not children:
+            if kingInCheck(pieces, squares, 'w' if white else 'b'):
+                table[index] = 0
+                mates.append(index)
+            else:
+                table[index] = DRAWN
+            continue
+        for childPieces, childSquares, converted in children:
+            if converted:
+                result, plies = workerTablebases.probePieces(childPieces, childSquares, not white)
+                if result:
+                    events.append((plies, index, result == -1))
+    return mates, events
+
+
+# positions one move before those resolved at level, split into sure wins and candidates to check for a loss
+def expandPositions(task):
+    level, indices = task
+    spec = workerSpec
+    table = workerTable
+    wins = []
+    candidates = []
+    for index in indices:
+        squares, white = spec.position(index)
+        lost = level % 2 == 0
+        for previousSquares, previousWhite in previousPositions(spec.pieces, squares, white):
+            for previous in spec.indices(previousSquares, previousWhite):
+                if table[previous] == UNKNOWN:
+                    (wins if lost else candidates).append(previous)
+    return wins, candidates
+
+
+# the candidates lost in level + 1 - every move reaches a position the opponent wins within level plies
+def checkLosses(task):
+    level, indices = task
+    spec = workerSpec
+    lost = []
+    for index in indices:
+        if workerTable[index] != UNKNOWN:
+            continue
+        squares, white = spec.position(index)
+        for childPieces, childSquares, converted in legalMoves(spec.pieces, squares, white):
+            outcome = childResult(childPieces, childSquares, not white, converted)
+            if outcome is None or outcome[0] != -1 or outcome[1] > level:
+                break
+        else:
+            lost.append(index)
+    return lost
+
+
+def chunks(items, count):
+    size = max(1, -(-len(items) // count))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# builds one table into directory, its smaller tables have to be there already
+def generateTable(name, directory=TABLEBASE_DIR, workers=None, out=sys.stdout):
+    spec = TableSpec(name)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    memory = shared_memory.SharedMemory(create=True, size=spec.size * 2)
+    pool = None
+    try:
+        memory.buf[:spec.size * 2] = b'\xff' * (spec.size * 2) # every int16 UNKNOWN
+        table = memory.buf[:spec.size * 2].cast('h')
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initWorker, (spec.name, memory.name, directory))
+            runAll = pool.map
+        else:
+            initWorker(spec.name, memory.name, directory)
+            runAll = lambda function, tasks: list(map(function, tasks))
+        step = max(1, spec.size // (workers * 16))
+        frontier = []
+        pending = {} # level: ([indices won at level + 1], [indices to check for a loss at level + 1])
+        for mates, events in runAll(initRange, [(i, min(i + step, spec.size)) for i in range(0, spec.size, step)]):
+            frontier += mates
+            for level, index, win in events:
+                pending.setdefault(level, ([], []))[0 if win else 1].append(index)
+        level = 0
+        longest = 0 if frontier else None
+        while frontier or any(key >= level for key in pending):
+            wins, candidates = pending.pop(level, ([], []))
+            for found, maybe in runAll(expandPositions, [(level, part) for part in chunks(frontier, workers * 4)]):
+                wins += found
+                candidates += maybe
+            frontier = []
+            for index in wins:
+                if table[index] == UNKNOWN:
+                    table[index] = longest = level + 1
+                    frontier.append(index)
+            candidates = list(set(index for index in candidates if table[index] == UNKNOWN))
+            for lost in runAll(checkLosses, [(level, part) for part in chunks(candidates, workers * 4)]):
+                for index in lost:
+                    table[index] = longest = level + 1
+                    frontier.append(index)
+            level += 1
+        path = saveTable(spec, table, directory)
+        table.release()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if workerMemory is not None and workerMemory.name == memory.name:
+            closeWorker()
+        memory.close()
+        memory.unlink()
+    if out is not None:
+        print('%-8s %9d positions  longest mate %9s  %6.1fs  %s'
+              % (spec.name, spec.size, 'none' if longest is None else '%d plies' % longest,
+                 time.perf_counter() - start, path), file=out)
+    return path
+
+
+# bit packs the finished table behind its header, written to a temporary file first so a table is never half there
+def saveTable(spec, table, directory):
+    codes = [value + 1 if value >= 0 else 0 for value in table]
+    bits = max(1, max(codes).bit_length())
+    packed = bytearray((spec.size * bits + 7) // 8 + 3) # the spare bytes let a probe always read three
+    bit = 0
+    for code in codes:
+        if code:
+            value = code << (bit & 7)
+            position = bit >> 3
+            while value:
+                packed[position] |= value & 0xff
+                value >>= 8
+                position += 1
+        bit += bits
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, spec.name + '.tb')
+    with open(path + '.tmp', 'wb') as f:
+        f.write(headerStruct.pack(MAGIC, VERSION, bits, spec.name.encode(), spec.size))
+        f.write(packed)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+# generates the tables for names and every smaller table they need, skipping the ones already in directory
+def generate(names, directory=TABLEBASE_DIR, workers=None, out=sys.stdout):
+    ordered = []
+    def visit(name):
+        name = materialName(*parseMaterial(name))
+        if name in ordered:
+            return
+        if len(name) - 1 > MAX_PIECES:
+            raise ValueError('at most %d pieces: %s' % (MAX_PIECES, name))
+        for dependency in sorted(dependencies(name)):
+            visit(dependency)
+        ordered.append(name)
+    for name in names:
+        visit(name)
+    for name in ordered:
+        if not os.path.exists(os.path.join(directory, name + '.tb')):
+            generateTable(name, directory, workers, out)
+    return ordered
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate and probe endgame tablebases')
+    parser.add_argument('command', choices=('generate', 'probe'))
+    parser.add_argument('args', nargs='+', help='material sets such as KQK or KBNvK to generate, or a FEN to probe')
+    parser.add_argument('--dir', default=TABLEBASE_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        generate(args.args, args.dir, args.workers)
+        return 0
+    tablebases = Tablebases(args.dir)
+    gs = ChessEngine.GameState.fromFEN(' '.join(args.args))
+    entry = tablebases.probe(gs)
+    if entry is None:
+        print('not in the tablebases')
+    else:
+        result, plies = entry
+        print('draw' if result == 0 else '%s in %d plies (mate in %d)'
+              % ('win' if result > 0 else 'loss', plies, (plies + 1) // 2))
+        for move in gs.getValidMoves():
+            gs.makeMove(move)
+            reply = tablebases.probe(gs)
+            gs.undoMove()
+            if reply is not None:
+                print('  %s %s' % (move.getChessNotation(), 'draw' if reply[0] == 0 else
+                                   '%s in %d' % ('win' if reply[0] < 0 else 'loss', reply[1] + 1)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Fixed size transposition table for the search, keyed by GameState.zobristKey.
+Entries live in three flat arrays instead of a dict of objects so millions of them stay cheap:
+keys (8 bytes), scores (8 bytes) and a packed 32-bit word holding depth, bound, best move and age.
+Each bucket has two slots - the first keeps the deepest result, the second is always replaced.
+"""
+
+from array import array
+
+EXACT = 0
+LOWERBOUND = 1 # score is at least this, the search failed high
+UPPERBOUND = 2 # score is at most this, the search failed low
+
+ENTRY_BYTES = 20
+SLOTS_PER_BUCKET = 2
+
+
+class TranspositionTable():
+    def __init__(self, sizeMB=16):
+        self.resize(sizeMB)
+
+    # reallocates the table to sizeMB megabytes, dropping every entry
+    def resize(self, sizeMB):
+        self.sizeMB = sizeMB
+        self.buckets = max(1, int(sizeMB * 1024 * 1024) // (ENTRY_BYTES * SLOTS_PER_BUCKET))
+        slots = self.buckets * SLOTS_PER_BUCKET
+        self.keys = array('Q', bytes(8 * slots))
+        self.scores = array('d', bytes(8 * slots))
+        self.data = array('I', bytes(4 * slots)) # depth + 1 (0 marks an empty slot) | bound << 8 | moveID << 10 | age << 24
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    # empties every slot without reallocating - a zero data word already marks a slot empty, so keys and scores can stay
+    def clear(self):
+        self.data = array('I', bytes(4 * len(self.data)))
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    # called once per search so entries from earlier searches are replaced first
+    def newSearch(self):
+        self.age = (self.age + 1) & 0xff
+
+    # returns (depth, score, bound, moveID) for key, or None if it is not stored
+    def probe(self, key):
+        self.probes += 1
+        slot = (key % self.buckets) * SLOTS_PER_BUCKET
+        for i in (slot, slot + 1):
+            if self.keys[i] == key:
+                data = self.data[i]
+                if data:
+                    self.hits += 1
+                    return (data & 0xff) - 1, self.scores[i], (data >> 8) & 0x3, (data >> 10) & 0x3fff
+        return None
+
+    # moveID 0 means no best move is known, Move.moveID never uses it for a real move
+    def store(self, key, depth, score, bound, moveID):
+        self.stores += 1
+        slot = (key % self.buckets) * SLOTS_PER_BUCKET
+        keptData = self.data[slot]
+        keptDepth = (keptData & 0xff) - 1
+        if self.keys[slot] != key and keptData and keptDepth > depth and keptData >> 24 == self.age:
+            slot += 1 # depth-preferred slot holds a deeper result from this search, use the always-replace slot
+        elif self.keys[slot + 1] == key:
+            self.data[slot + 1] = 0 # the same position is about to move into the depth-preferred slot
+        if moveID == 0 and self.keys[slot] == key:
+            moveID = (self.data[slot] >> 10) & 0x3fff # keep the old best move when this search found none
+        self.keys[slot] = key
+        self.scores[slot] = score
+        self.data[slot] = (depth + 1) | bound << 8 | moveID << 10 | self.age << 24
+
+    # fraction of the slots in use, sampled from the first thousand
+    def hashfull(self):
+        sample = min(1000, len(self.data))
+        used = sum(1 for i in range(sample) if self.data[i] and self.data[i] >> 24 == self.age)
+        return used / sample
@@ -0,0 +1,322 @@
+"""
+UCI front end - runs the engine headless over stdin and stdout so match runners and tournament managers can drive it.
+Never imports pygame. Start it with `python uci.py`.
+Supports uci, isready, ucinewgame, setoption (Hash, Threads, Ponder, Backend, OwnBook, BookFile, TablebasePath, StatsLog),
+position startpos/fen ... moves ..., go depth/movetime/wtime/btime/winc/binc/movestogo/nodes/infinite/ponder, ponderhit, stop and quit.
+"""
+
+import sys
+import threading
+import ChessEngine, chessAI, openingBook, searchStats, tablebase
+from transpositionTable import TranspositionTable
+
+ENGINE_NAME = 'Chess-AI'
+ENGINE_AUTHOR = 'rebeccaansell'
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+DEFAULT_MOVES_TO_GO = 30 # how many moves the remaining clock time is spread over when the GUI does not say
+MOVE_OVERHEAD_MS = 50 # kept back from every move for the GUI and the pipe
+
+
+# UCI notation for a move, e.g. e2e4 or e7e8q - the engine always promotes to a queen
+def uciMove(move):
+    return move.getChessNotation() + ('q' if move.isPawnPromotion else '')
+
+
+# finds the valid move a UCI move string names, under-promotions become queen promotions
+def parseMove(gs, text):
+    for move in gs.getValidMoves():
+        if move.getChessNotation() == text[:4]:
+            return move
+    return None
+
+
+# seconds to spend on this move from the clock parameters of a go command
+def allocateTime(params, whiteToMove):
+    remaining = params.get('wtime' if whiteToMove else 'btime')
+    if remaining is None:
+        return None
+    increment = params.get('winc' if whiteToMove else 'binc', 0)
+    movesToGo = params.get('movestogo') or DEFAULT_MOVES_TO_GO
+    budget = remaining / movesToGo + increment * 3 / 4
+    budget = min(budget, remaining / 2) - MOVE_OVERHEAD_MS # never risk the flag on a single move
+    return max(budget, 10) / 1000
+
+
+# the score part of an info line, mates are reported in moves from the principal variation's length
+def uciScore(score, pv):
+    if score >= chessAI.CHECKMATE:
+        return 'mate %d' % ((len(pv) + 1) // 2)
+    if score <= -chessAI.CHECKMATE:
+        return 'mate -%d' % (len(pv) // 2)
+    if abs(score) >= chessAI.TABLEBASE_WIN - chessAI.MAX_TABLEBASE_PLIES: # a tablebase result, plies to mate below TABLEBASE_WIN
+        plies = chessAI.TABLEBASE_WIN - abs(score)
+        return 'mate %d' % ((plies + 1) // 2) if score > 0 else 'mate -%d' % (plies // 2)
+    return 'cp %d' % round(score * 100)
+
+
+class UCIEngine():
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()
+        self.hashSizeMB = chessAI.HASH_SIZE_MB
+        self.threads = 1
+        self.backend = 'mailbox'
+        self.searcher = chessAI.Searcher(TranspositionTable(self.hashSizeMB))
+        self.searcher.onIteration = self.sendInfo
+        self.parallelSearcher = None # process pool, created when Threads is above 1
+        self.gs = ChessEngine.newGameState(self.backend)
+        self.searchThread = None
+        self.stopSearch = None
+        self.holdBestMove = False # infinite and ponder searches only answer after stop or ponderhit
+        self.heldResult = None
+        self.ponderTime = None
+        self.ownBook = False
+        self.book = None # opened when BookFile is set
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    # handles one line of input, returns False once the engine should exit
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send('id name ' + ENGINE_NAME)
+            self.send('id author ' + ENGINE_AUTHOR)
+            self.send('option name Hash type spin default %d min 1 max %d' % (chessAI.HASH_SIZE_MB, MAX_HASH_MB))
+            self.send('option name Threads type spin default 1 min 1 max %d' % MAX_THREADS)
+            self.send('option name Ponder type check default false')
+            self.send('option name Backend type combo default mailbox' + ''.join(' var ' + name for name in ChessEngine.backends))
+            self.send('option name OwnBook type check default false')
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('option name StatsLog type string default <empty>')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'ucinewgame':
+            self.waitForSearch()
+            self.searcher.transpositionTable.clear()
+        elif command == 'setoption':
+            self.waitForSearch()
+            self.setOption(args)
+        elif command == 'position':
+            self.waitForSearch()
+            self.setPosition(args)
+        elif command == 'go':
+            self.waitForSearch()
+            self.go(args)
+        elif command == 'stop':
+            self.stop()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            self.stop()
+            if self.parallelSearcher is not None:
+                self.parallelSearcher.close()
+            if self.book is not None:
+                self.book.close()
+            if self.searcher.tablebases is not None:
+                self.searcher.tablebases.close()
+            self.closeStatsLog()
+            return False
+        return True
+
+    # setoption name <name> value <value>, names can hold spaces
+    def setOption(self, args):
+        if 'name' not in args:
+            return
+        valueAt = args.index('value') if 'value' in args else len(args)
+        name = ' '.join(args[args.index('name') + 1:valueAt]).lower()
+        value = ' '.join(args[valueAt + 1:])
+        if name == 'hash':
+            self.hashSizeMB = max(1, min(MAX_HASH_MB, int(value)))
+            self.searcher.transpositionTable.resize(self.hashSizeMB)
+        elif name == 'threads':
+            self.threads = max(1, min(MAX_THREADS, int(value)))
+            if self.parallelSearcher is not None:
+                self.parallelSearcher.close()
+                self.parallelSearcher = None
+        elif name == 'backend' and value in ChessEngine.backends:
+            self.backend = value
+            self.gs = ChessEngine.newGameState(self.backend)
+        elif name == 'ownbook':
+            self.ownBook = value.lower() == 'true'
+        elif name == 'bookfile':
+            if self.book is not None:
+                self.book.close()
+                self.book = None
+            if value and value != '<empty>':
+                try:
+                    self.book = openingBook.OpeningBook(value)
+                except OSError as error:
+                    self.send('info string cannot open book: ' + str(error))
+        elif name == 'tablebasepath':
+            if self.searcher.tablebases is not None:
+                self.searcher.tablebases.close()
+                self.searcher.tablebases = None
+            if value and value != '<empty>':
+                try:
+                    self.searcher.tablebases = tablebase.Tablebases(value)
+                    self.send('info string %d tablebases loaded' % len(self.searcher.tablebases.tables))
+                except (OSError, ValueError) as error:
+                    self.send('info string cannot open tablebases: ' + str(error))
+        elif name == 'statslog': # every single threaded search appends its searchStats.SearchStats to the file as JSON
+            self.closeStatsLog()
+            if value and value != '<empty>':
+                try:
+                    self.searcher.instrumentation = searchStats.Instrumentation(open(value, 'a'))
+                except OSError as error:
+                    self.send('info string cannot open stats log: ' + str(error))
+
+    def closeStatsLog(self):
+        if self.searcher.instrumentation is not None:
+            self.searcher.instrumentation.sink.close()
+            self.searcher.instrumentation = None
+
+    def setPosition(self, args):
+        if 'moves' in args:
+            movesAt = args.index('moves')
+            moves = args[movesAt + 1:]
+            args = args[:movesAt]
+        else:
+            moves = []
+        if args and args[0] == 'fen':
+            self.gs = ChessEngine.newGameState(self.backend, ' '.join(args[1:]))
+        else:
+            self.gs = ChessEngine.newGameState(self.backend)
+        for text in moves:
+            move = parseMove(self.gs, text)
+            if move is None:
+                self.send('info string illegal move ' + text)
+                return
+            self.gs.makeMove(move)
+
+    def go(self, args):
+        params = {}
+        flags = set()
+        i = 0
+        while i < len(args):
+            if args[i] in ('infinite', 'ponder'):
+                flags.add(args[i])
+                i += 1
+            elif args[i] in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'nodes') and i + 1 < len(args):
+                params[args[i]] = int(args[i + 1])
+                i += 2
+            else:
+                i += 1 # searchmoves and mate are not supported
+        depth = params.get('depth')
+        nodes = params.get('nodes')
+        movetime = params['movetime'] / 1000 if 'movetime' in params else allocateTime(params, self.gs.whiteToMove)
+        validMoves = self.gs.getValidMoves()
+        if self.ownBook and self.book is not None and not flags:
+            bookMove = self.book.chooseMove(self.gs, validMoves)
+            if bookMove is not None: # answered from the book, nothing to search
+                self.send('info string book move')
+                self.send('bestmove ' + uciMove(bookMove))
+                return
+        with self.outputLock:
+            self.heldResult = None
+            self.holdBestMove = bool(flags)
+        if 'ponder' in flags:
+            # searched without limits until ponderhit, then the clock limits of this go command apply
+            self.ponderTime = movetime
+            self.stopSearch = self.searcher.stop
+            self.searchThread = self.searcher.searchInBackground(self.gs, validMoves, self.searchFinished, depth, None, nodes, infinite=True)
+        elif self.threads > 1 and len(validMoves) > 1:
+            if self.parallelSearcher is None:
+                import parallelSearch # imported on demand, it starts worker processes
+                self.parallelSearcher = parallelSearch.ParallelSearcher(self.threads, self.hashSizeMB)
+            if 'infinite' in flags and depth is None:
+                depth = chessAI.MAX_DEPTH
+            parallelSearcher = self.parallelSearcher
+            self.stopSearch = parallelSearcher.stop
+            self.searchThread = threading.Thread(target=lambda: self.searchFinished(
+                self.sendInfo(parallelSearcher.search(self.gs, validMoves, depth, movetime, nodes))), daemon=True)
+            self.searchThread.start()
+        else:
+            self.stopSearch = self.searcher.stop
+            self.searchThread = self.searcher.searchInBackground(self.gs, validMoves, self.searchFinished, depth, movetime, nodes,
+                                                                 infinite='infinite' in flags)
+
+    # info line for a finished depth, returns the result so it can be passed along
+    def sendInfo(self, result):
+        nodesPerSecond = int(result.nodesPerSecond())
+        self.send('info depth %d score %s nodes %d nps %d time %d pv %s'
+                  % (result.depth, uciScore(result.score, result.pv), result.nodes, nodesPerSecond,
+                     int(result.time * 1000), ' '.join(uciMove(move) for move in result.pv)))
+        return result
+
+    # runs on the search thread when the search returns
+    def searchFinished(self, result):
+        with self.outputLock:
+            if self.holdBestMove:
+                self.heldResult = result
+                return
+        self.sendBestMove(result)
+
+    def sendBestMove(self, result):
+        if result.bestMove is None:
+            self.send('bestmove 0000')
+        elif len(result.pv) > 1 and result.pv[0] == result.bestMove:
+            self.send('bestmove %s ponder %s' % (uciMove(result.bestMove), uciMove(result.pv[1])))
+        else:
+            self.send('bestmove ' + uciMove(result.bestMove))
+
+    # the search answers with its bestmove, a held result is sent now
+    def stop(self):
+        if self.searchThread is None:
+            return
+        with self.outputLock:
+            self.holdBestMove = False
+            heldResult = self.heldResult
+            self.heldResult = None
+        if heldResult is not None:
+            self.sendBestMove(heldResult)
+        self.stopSearch()
+        self.searchThread.join()
+        self.searchThread = None
+
+    # the opponent played the expected move, the ponder search becomes the real one
+    def ponderhit(self):
+        if self.searchThread is None:
+            return
+        with self.outputLock:
+            self.holdBestMove = False
+            heldResult = self.heldResult
+            self.heldResult = None
+        if heldResult is not None: # the ponder search finished by itself, answer at once
+            self.sendBestMove(heldResult)
+        else:
+            self.searcher.ponderhit(movetime=self.ponderTime)
+
+    # commands that change the position or options wait for a search that is still finishing
+    def waitForSearch(self):
+        if self.searchThread is not None:
+            if self.holdBestMove:
+                self.stop()
+            else:
+                self.searchThread.join()
+                self.searchThread = None
+
+    def run(self, input=sys.stdin):
+        for line in input:
+            try:
+                if not self.handle(line):
+                    break
+            except ValueError as error: # a malformed number or FEN, the engine keeps running
+                self.send('info string ' + str(error))
+        self.stop()
+
+
+def main():
+    UCIEngine().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Vectorized evaluation - scores many positions at once with NumPy, giving exactly what chessAI.scoreBoard gives one at a time.
+NumPy is only needed here, the rest of the engine runs without it (pip install numpy).
+
+Positions come in one of two layouts:
+    (N, 64) int8     one code per square, the ChessEngine.pieceCodes index - the first 64 bytes of GameState.toBytes
+    (N, 12, 64) int8 one plane per piece in pieceCodes order (wp, wN, ... bK), 1 where that piece stands
+Squares run a8, b8 ... h1, the same order as GameState.board. The weights are read from the engine's own
+materialValues and positionValues, so the two evaluations can not drift apart.
+
+    python vectorEval.py [--positions 1000000]    checks against scoreBoard and reports positions/s
+"""
+
+import argparse
+import random
+import time
+import numpy as np
+import ChessEngine, chessAI
+
+CHUNK_SIZE = 65536 # positions per block, so the temporaries stay a few tens of MB however many positions come in
+
+# (13, 64) material and tenths-of-a-point position values by piece code and square, code 0 is an empty square
+materialTable = np.array([ChessEngine.materialValues[piece] for piece in ChessEngine.pieceCodes], dtype=np.int64)
+positionTable = np.array([ChessEngine.positionValues[piece] for piece in ChessEngine.pieceCodes], dtype=np.int64)
+# both values packed into one int32, material * 4096 + position, so a single gather and sum gives the two totals
+# a position total is at most 32 pieces * 8 tenths either way, far inside the 2048 the packing leaves it
+packedTable = (materialTable * 4096 + positionTable).astype(np.int32).ravel()
+squareOffsets = np.arange(64) # added to code * 64 to index the flattened table
+# (768, 2) weights for the plane layout, one row per piece plane and square - material in column 0, position in column 1
+planeWeights = np.stack([materialTable[1:].ravel(), positionTable[1:].ravel()], axis=1).astype(np.float32)
+
+
+# (N, 64) int8 piece codes for a list of game states
+def encodeBoards(states):
+    data = np.frombuffer(b''.join(gs.toBytes() for gs in states), dtype=np.int8)
+    return data.reshape(len(states), 66)[:, :64].copy()
+
+
+# (N, 12, 64) int8 piece planes from (N, 64) piece codes
+def encodePlanes(codes):
+    codes = np.asarray(codes)
+    planes = np.zeros((len(codes), 12, 64), dtype=np.int8)
+    rows, squares = np.nonzero(codes)
+    planes[rows, codes[rows, squares] - 1, squares] = 1
+    return planes
+
+
+# material and position totals of a block of piece codes, each an (n,) int64 array
+def codeTotals(codes):
+    totals = packedTable[codes.astype(np.intp) * 64 + squareOffsets].sum(axis=1, dtype=np.int64)
+    material = (totals + 2048) >> 12
+    return material, totals - material * 4096
+
+
+# material and position totals of a block of piece planes, one matrix product for both
+# every partial sum is a small integer, which float32 holds exactly, so this is as exact as integer arithmetic
+def planeTotals(planes):
+    totals = (planes.reshape(len(planes), 768).astype(np.float32) @ planeWeights).astype(np.int64)
+    return totals[:, 0], totals[:, 1]
+
+
+# scoreBoard for every position, positive is good for white; takes either layout and returns an (N,) float64 array
+# checkmate and stalemate are not visible in a board array, scoreGameStates covers them
+def evaluateBatch(positions, chunkSize=CHUNK_SIZE):
+    positions = np.asarray(positions)
+    if positions.ndim == 2 and positions.shape[1] == 64:
+        totals = codeTotals
+    elif positions.ndim == 3 and positions.shape[1:] == (12, 64):
+        totals = planeTotals
+    else:
+        raise ValueError("expected an (N, 64) or (N, 12, 64) array, got shape " + str(positions.shape))
+    scores = np.empty(len(positions), dtype=np.float64)
+    for start in range(0, len(positions), chunkSize):
+        material, position = totals(positions[start:start + chunkSize])
+        # the same operations in the same order as scoreBoard, so every score matches to the last bit
+        scores[start:start + chunkSize] = material + position * 0.1
+    return scores
+
+
+# chessAI.scoreBoard for a list of game states, mates, stalemates and draws included once getValidMoves has flagged them
+def scoreGameStates(states):
+    scores = evaluateBatch(encodeBoards(states)).tolist()
+    for i, gs in enumerate(states):
+        if gs.checkMate or gs.staleMate or gs.repetitionDraw or gs.fiftyMoveDraw:
+            scores[i] = chessAI.scoreBoard(gs)
+    return scores
+
+
+# game states from random play, for checking and benchmarking
+def randomGameStates(count, seed=0):
+    rng = random.Random(seed)
+    states = []
+    while len(states) < count:
+        gs = ChessEngine.GameState()
+        for ply in range(rng.randint(0, 120)):
+            moves = gs.getValidMoves()
+            if not moves:
+                break
+            gs.makeMove(rng.choice(moves))
+        states.append(ChessEngine.GameState.fromFEN(gs.toFEN())) # drops the move log, only the position matters here
+    return states
+
+
+# checks evaluateBatch against scoreBoard on a sample of positions, then times both layouts on N positions
+def benchmark(positions=1000000, sample=2000):
+    states = randomGameStates(sample)
+    codes = encodeBoards(states)
+    expected = [chessAI.scoreBoard(gs) for gs in states]
+    for name, batch in (('codes', codes), ('planes', encodePlanes(codes))):
+        mismatches = sum(1 for score, want in zip(evaluateBatch(batch).tolist(), expected) if score != want)
+        print('%-6s %d of %d positions differ from scoreBoard' % (name, mismatches, sample))
+
+    start = time.perf_counter()
+    for gs in states:
+        gs.computeScores()
+    loopRate = sample / (time.perf_counter() - start)
+    print('%-6s %12.0f positions/s  (full recompute, one GameState at a time)' % ('python', loopRate))
+    allCodes = np.resize(codes, (positions, 64))
+    start = time.perf_counter()
+    evaluateBatch(allCodes)
+    rate = positions / (time.perf_counter() - start)
+    print('%-6s %12.0f positions/s  N=%d  %.0fx' % ('codes', rate, positions, rate / loopRate))
+    # planes take 12 times the memory, so they are timed one chunk at a time
+    planes = encodePlanes(allCodes[:CHUNK_SIZE])
+    start = time.perf_counter()
+    for done in range(0, positions, CHUNK_SIZE):
+        evaluateBatch(planes[:positions - done])
+    rate = positions / (time.perf_counter() - start)
+    print('%-6s %12.0f positions/s  N=%d  %.0fx' % ('planes', rate, positions, rate / loopRate))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vectorized evaluation check and throughput benchmark')
+    parser.add_argument('--positions', type=int, default=1000000)
+    parser.add_argument('--sample', type=int, default=2000, help='positions checked against scoreBoard')
+    args = parser.parse_args()
+    benchmark(args.positions, args.sample)